@@ -1,21 +1,36 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import os
+import time
 import logging
+import zlib
+import contextvars
 from datetime import datetime
 from dotenv import load_dotenv
-import spacy
 import nltk
 
 # Load environment variables from .env file
 load_dotenv()
-from transformers import pipeline, AutoTokenizer, AutoModelForSequenceClassification
-import torch
 from supabase import create_client, Client
 import json
-import re
-from typing import Dict, List, Any
-from sentence_transformers import SentenceTransformer, util
+from typing import Dict, List, Any, Optional
+from functools import wraps
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from batching import batcher_from_env
+from result_cache import cache_from_env, pack_vector, unpack_vector
+from model_registry import ModelRegistry
+from keywords import (SPACY_EXCLUDE, candidates_from_doc, candidates_from_text, keyword_stats_from_env,
+                      rank_keywords)
+from lexicon import DreamLexicon, lexicon_index_dir, lexicon_path
+from vector_store import DreamVectorStore, vector_store_dir
+from word_lexicon import WordLexicon, extractive_summary, word_lexicon_path
+from inference_backend import configured_backend, load_sentence_encoder, load_text_classifier
+from metrics import (REGISTRY, REQUEST_SECONDS, REQUESTS_IN_FLIGHT, fallback, observe_model,
+                     request_timings, start_request_timings, timed_stage)
+from inference_workers import workers_from_env
+from inference_gate import (DeadlineExceeded, Overloaded, check_deadline, deadline_expired,
+                            deadline_from_headers, deadline_scope, gate_from_env)
+import numpy as np
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -28,48 +43,170 @@ logger = logging.getLogger(__name__)
 # Initialize Supabase client
 supabase_url = os.getenv('SUPABASE_URL')
 supabase_key = os.getenv('SUPABASE_SERVICE_KEY')
-supabase: Client = create_client(supabase_url, supabase_key)
+supabase: Client = create_client(supabase_url, supabase_key) if supabase_url and supabase_key else None
 
-# Load NLP models
-try:
-    # Load spaCy model for NER and linguistic analysis
-    nlp = spacy.load("en_core_web_sm")
-    
-    # Load emotion classification model
-    emotion_classifier = pipeline(
-        "text-classification",
-        model="j-hartmann/emotion-english-distilroberta-base",
-        device=0 if torch.cuda.is_available() else -1
-    )
-    
-    # Load sentiment analysis
-    sentiment_analyzer = pipeline(
-        "sentiment-analysis",
-        model="cardiffnlp/twitter-roberta-base-sentiment-latest",
-        device=0 if torch.cuda.is_available() else -1
-    )
-    
-    # Load summarization model
-    summarizer = pipeline(
-        "summarization",
-        model="facebook/bart-large-cnn",
-        device=0 if torch.cuda.is_available() else -1
+# Model identifiers (also part of the result cache key)
+SPACY_MODEL = "en_core_web_sm"
+EMOTION_MODEL = "j-hartmann/emotion-english-distilroberta-base"
+SENTIMENT_MODEL = "cardiffnlp/twitter-roberta-base-sentiment-latest"
+SUMMARY_MODEL = "facebook/bart-large-cnn"
+SENTENCE_MODEL = "all-MiniLM-L6-v2"
+
+# Bump when analysis logic changes so cached results are not reused
+ANALYZER_VERSION = "4"
+
+# Summaries: 'map_reduce' covers the whole dream in token-budgeted chunks,
+# 'truncate' keeps the legacy 1024-character prefix behaviour
+SUMMARY_MODE = os.getenv('NLP_SUMMARY_MODE', 'map_reduce')
+SUMMARY_CHUNK_TOKENS = int(os.getenv('NLP_SUMMARY_CHUNK_TOKENS', 900))
+SUMMARY_CHUNK_SENTENCES = 32
+
+# Emotion and sentiment score each sentence window; over-long sentences are split
+# by words and long dreams pack adjacent sentences together, so a dream costs at most
+# ceil(MAX_WINDOWS / batch size) forward passes and windows stay under the 512-token limit
+WINDOW_MAX_WORDS = int(os.getenv('NLP_WINDOW_MAX_WORDS', 200))
+MAX_WINDOWS = int(os.getenv('NLP_MAX_WINDOWS', 32))
+WINDOW_PACK_SENTENCES = 8
+
+# Inputs per padded forward pass, however many a call carries (e.g. every window of an /analyze-batch);
+# summaries are generated from long inputs, so they get a smaller batch
+MODEL_BATCH_SIZE = int(os.getenv('NLP_MODEL_BATCH_SIZE', os.getenv('NLP_BATCH_MAX_SIZE', 32)))
+SUMMARY_BATCH_SIZE = int(os.getenv('NLP_SUMMARY_BATCH_SIZE', 4))
+
+# Analysis tiers: 'full' runs the models, 'lite' scores word lexicons only (no model is loaded)
+ANALYSIS_TIERS = ('full', 'lite')
+DEFAULT_TIER = os.getenv('NLP_DEFAULT_TIER', 'full')
+
+# Runtime requested for the emotion, sentiment and sentence models: torch (fp32), quantized (int8) or onnx
+INFERENCE_BACKEND = configured_backend()
+# Runtime each of those models actually loaded on; a model falls back to torch if its requested backend fails
+MODEL_BACKENDS: Dict[str, str] = {}
+
+def _record_backend(model: str, loaded: tuple):
+    model_object, backend = loaded
+    if backend != INFERENCE_BACKEND:
+        logger.warning(f"{model} is running on {backend}, not the requested {INFERENCE_BACKEND}")
+    MODEL_BACKENDS[model] = backend
+    return model_object
+
+def model_backend(model: str) -> str:
+    return MODEL_BACKENDS.get(model, 'torch')
+
+def effective_backend() -> str:
+    """The backend(s) the loaded models run on, e.g. 'onnx', or 'onnx+torch' after a partial fallback."""
+    return '+'.join(sorted(set(MODEL_BACKENDS.values()))) or INFERENCE_BACKEND
+
+def _hf_pipeline(task: str, model: str):
+    import torch
+    from transformers import pipeline
+    return pipeline(task, model=model, device=0 if torch.cuda.is_available() else -1)
+
+def _load_spacy():
+    import spacy
+    return spacy.load(SPACY_MODEL, exclude=SPACY_EXCLUDE)
+
+def _load_sentence_transformer():
+    return _record_backend(SENTENCE_MODEL, load_sentence_encoder(SENTENCE_MODEL, INFERENCE_BACKEND))
+
+# NLP models are loaded lazily on first use, or up front via warmup
+models = ModelRegistry()
+# spaCy model for NER, POS tags and lemmas (keyword extraction)
+models.register('spacy', _load_spacy)
+models.register('emotion_classifier', lambda: _record_backend(
+    EMOTION_MODEL, load_text_classifier("text-classification", EMOTION_MODEL, INFERENCE_BACKEND)))
+models.register('sentiment_analyzer', lambda: _record_backend(
+    SENTIMENT_MODEL, load_text_classifier("sentiment-analysis", SENTIMENT_MODEL, INFERENCE_BACKEND)))
+models.register('summarizer', lambda: _hf_pipeline("summarization", SUMMARY_MODEL))
+# Sentence transformer model for semantic analysis
+models.register('sentence_transformer', _load_sentence_transformer)
+
+# Optional inference worker processes (NLP_INFERENCE_WORKERS); model calls below run on
+# the least-loaded worker when they are started, and in-process otherwise
+inference_workers = workers_from_env()
+
+@inference_workers.register
+def _run_classifier(name: str, texts: List[str]):
+    # Full label distribution per input; truncation guards the model's token limit
+    return models.get(name)(texts, batch_size=MODEL_BATCH_SIZE, top_k=None, truncation=True)
+
+@inference_workers.register
+def _run_encoder(sentences: List[str]):
+    return models.get('sentence_transformer').encode(
+        sentences, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=False
     )
 
-    # Load sentence transformer model for semantic analysis
-    sentence_transformer = SentenceTransformer('all-MiniLM-L6-v2')
-    
-    logger.info("All NLP models loaded successfully")
-    
-except Exception as e:
-    logger.error(f"Error loading NLP models: {e}")
-    # Fallback to basic processing if models fail to load
-    nlp = None
-    emotion_classifier = None
-    sentiment_analyzer = None
-    summarizer = None
+@inference_workers.register
+def _run_summarizer(inputs: List[str], **kwargs):
+    return models.get('summarizer')(inputs, batch_size=SUMMARY_BATCH_SIZE, **kwargs)
+
+def _classify(name: str, texts: List[str]):
+    with observe_model(name, len(texts)):
+        return inference_workers.call(_run_classifier, name, texts, weight=len(texts))
+
+def _encode(sentences: List[str]):
+    with observe_model('sentence_transformer', len(sentences)):
+        return inference_workers.call(_run_encoder, sentences, weight=len(sentences))
+
+def _summarize(inputs: List[str], **kwargs):
+    with observe_model('summarizer', len(inputs)):
+        return inference_workers.call(_run_summarizer, inputs, weight=len(inputs), **kwargs)
+
+def start_inference_workers():
+    """Load the worker-served models, then fork the inference workers so they share the weights."""
+    inference_workers.start(before_fork=lambda: models.warmup(
+        ['emotion_classifier', 'sentiment_analyzer', 'summarizer', 'sentence_transformer']
+    ))
+
+# Micro-batchers: concurrent requests share one forward pass per model, with up to one
+# batch per inference worker in flight
+_batch_concurrency = max(1, inference_workers.processes)
+emotion_batcher = batcher_from_env(lambda texts: _classify('emotion_classifier', texts), 'emotion', _batch_concurrency)
+sentiment_batcher = batcher_from_env(lambda texts: _classify('sentiment_analyzer', texts), 'sentiment', _batch_concurrency)
+encode_batcher = batcher_from_env(_encode, 'encode', _batch_concurrency)
+
+# Per-stage result cache keyed on normalized content + model + analyzer version
+result_cache = cache_from_env()
+# Per-sentence/window/chunk results, so an edited dream only re-runs the models on what changed
+sentence_cache = cache_from_env('NLP_SENTENCE_CACHE', 20000)
+
+# Document frequencies over analyzed dreams, for TF-IDF keyword ranking
+keyword_stats = keyword_stats_from_env()
+
+# Bounded admission for inference: excess requests are shed and expired ones dropped
+inference_gate = gate_from_env()
+REQUEST_TIMEOUT_SECONDS = float(os.getenv('NLP_REQUEST_TIMEOUT_SECONDS', 25))
+
+class StageUnavailable(RuntimeError):
+    """The model a stage needs could not be loaded."""
+
+def _stable_groups(pieces: List[str], sizes: List[int], budget: int, average: int) -> List[List[int]]:
+    """Group consecutive pieces (by index) into groups of at most `budget` total size.
+
+    A group ends after a piece whose hash picks it (about one in `average`), or
+    before the budget would be exceeded. Boundaries depend only on nearby
+    content, unlike packing greedily from the start, so editing one piece moves
+    at most its own group's boundaries and the rest keep their cache keys.
+    """
+    groups, current, total = [], [], 0
+    for i, (piece, size) in enumerate(zip(pieces, sizes)):
+        if current and total + size > budget:
+            groups.append(current)
+            current, total = [], 0
+        current.append(i)
+        total += size
+        if zlib.crc32(piece.encode('utf-8')) % average == 0:
+            groups.append(current)
+            current, total = [], 0
+    if current:
+        groups.append(current)
+    return groups
 
 class DreamAnalyzer:
+    """Analysis stages. The *_batch methods isolate failures per item: a failed batched call is
+    retried one text at a time, and a text that still fails (or whose model is unavailable)
+    gets the stage's fallback result, or with strict=True its exception, in its slot.
+    """
+
     def __init__(self):
         self.emotion_colors = {
             'joy': '#F59E0B',
@@ -84,181 +221,771 @@ class DreamAnalyzer:
             'trust': '#06B6D4',
             'anticipation': '#A855F7'
         }
-        self.themes = {
-            'Flying/Freedom': 'Dreams about flying, soaring, or being weightless, symbolizing freedom and liberation.',
-            'Water/Emotions': 'Dreams involving water, oceans, or rivers, reflecting deep emotions and the subconscious.',
-            'Chase/Anxiety': 'Dreams of being chased or pursued, often indicating anxiety or avoidance of a situation.',
-            'Death/Transformation': 'Dreams about death, which usually symbolize an end of something and a new beginning or transformation.',
-            'Animals': 'Dreams with animals often represent our primal instincts, hidden desires, or aspects of our own personality.',
-            'Travel/Journey': 'Dreams about a journey or travel, symbolizing the path of life and personal growth.',
-            'Falling': 'Dreams of falling can indicate feelings of insecurity, loss of control, or lack of support.',
-            'Teeth Falling Out': 'A common dream related to stress, communication issues, or concerns about appearance.'
-        }
-        self.symbols = {
-            'House': 'Represents the self or the psyche. Different rooms can symbolize different aspects of your life.',
-            'Car': 'Symbolizes the direction and control you have in your own life.',
-            'Baby': 'Represents new beginnings, vulnerability, or a new idea or project.',
-            'Mirror': 'Relates to self-perception, identity, and how you see yourself.',
-            'Snake': 'A complex symbol that can represent healing and transformation, or a hidden threat and fear.'
-        }
-        if sentence_transformer:
-            self.theme_embeddings = sentence_transformer.encode(list(self.themes.values()), convert_to_tensor=True)
-            self.symbol_embeddings = sentence_transformer.encode(list(self.symbols.values()), convert_to_tensor=True)
+        # Themes and symbols come from the lexicon data file; their embeddings
+        # are precomputed by build_lexicon_index.py and memory-mapped
+        self.lexicon = DreamLexicon(lexicon_path())
+        self.themes = self.lexicon.entries('themes')
+        self.symbols = self.lexicon.entries('symbols')
+        models.register('lexicon_index', self._load_lexicon_index)
+        # Word-level weights for the lite tier, over the same themes and symbols
+        self.word_lexicon = WordLexicon(word_lexicon_path(), self.lexicon)
+
+    def _load_lexicon_index(self) -> DreamLexicon:
+        index_dir = lexicon_index_dir()
+        if self.lexicon.load_index(index_dir, SENTENCE_MODEL):
+            return self.lexicon
+
+        sentence_transformer = models.get('sentence_transformer')
+        if not sentence_transformer:
+            raise RuntimeError('sentence_transformer is not available')
+        # No usable prebuilt index: build it once so later starts can memory-map it. Workers starting
+        # together take turns; the ones after the first find the index already built.
+        with self.lexicon.build_lock(index_dir):
+            if self.lexicon.load_index(index_dir, SENTENCE_MODEL):
+                return self.lexicon
+            logger.warning(f"Encoding {len(self.lexicon.names)} lexicon entries; run build_lexicon_index.py at deploy time to skip this")
+            self.lexicon.build_index(sentence_transformer, index_dir, SENTENCE_MODEL)
+            if not self.lexicon.load_index(index_dir, SENTENCE_MODEL):
+                raise RuntimeError(f'Could not load lexicon index from {index_dir}')
+        return self.lexicon
     
+    def _isolated(self, stage: str, texts: List[str], run, fallback_result, strict: bool) -> List[Any]:
+        """run(texts), or run([text]) for each text if the batched call fails."""
+        try:
+            return list(run(texts))
+        except DeadlineExceeded:
+            raise
+        except Exception as e:
+            if len(texts) == 1:
+                results = [e]
+            else:
+                logger.error(f"Batch {stage} error, retrying per item: {e}")
+                results = []
+                for text in texts:
+                    try:
+                        results.append(run([text])[0])
+                    except DeadlineExceeded:
+                        raise
+                    except Exception as item_error:
+                        results.append(item_error)
+
+        for i, result in enumerate(results):
+            if isinstance(result, Exception):
+                logger.error(f"{stage} error: {result}")
+                fallback(stage, 'error')
+                if not strict:
+                    results[i] = fallback_result(texts[i])
+        return results
+
+    def _unavailable(self, stage: str, model: str, texts: List[str], fallback_result, strict: bool) -> List[Any]:
+        fallback(stage, 'model_unavailable')
+        if strict:
+            return [StageUnavailable(f'{model} is not available') for _ in texts]
+        return [fallback_result(text) for text in texts]
+
+    def _cached(self, stage: str, model: str, texts: List[str], compute, cache=None) -> List[Any]:
+        """Serve each text from the result cache, computing only the (distinct) misses in one call.
+
+        `compute` raises on failure so fallback results are never cached.
+        """
+        cache = cache if cache is not None else result_cache
+        # Quantized/ONNX outputs can differ slightly from fp32, so the backend is part of the key
+        model = f'{model}@{model_backend(model)}'
+        keys = [cache.key(stage, text, model, ANALYZER_VERSION) for text in texts]
+        results = [None] * len(texts)
+        misses = {}
+        for i, key in enumerate(keys):
+            if key in misses:
+                misses[key].append(i)
+                continue
+            hit, value = cache.get(stage, key)
+            if hit:
+                results[i] = value
+            else:
+                misses[key] = [i]
+
+        if misses:
+            # Drop the work rather than run the model for a caller that has given up
+            check_deadline()
+            computed = compute([texts[indices[0]] for indices in misses.values()])
+            for (key, indices), value in zip(misses.items(), computed):
+                for i in indices:
+                    results[i] = value
+                cache.set(stage, key, value)
+        return results
+
+    @timed_stage('keywords')
     def extract_keywords(self, text: str) -> List[str]:
         """Extract meaningful keywords using spaCy NLP"""
+        return self.extract_keywords_batch([text])[0]
+
+    @timed_stage('keywords_batch')
+    def extract_keywords_batch(self, texts: List[str], strict: bool = False) -> List[List[str]]:
+        """Extract keywords for many texts with a single nlp.pipe pass, ranked by TF-IDF"""
+        # Fallback keyword extraction; not counted in the corpus stats (surface forms, not lemmas)
+        regex_keywords = lambda text: rank_keywords(candidates_from_text(text), keyword_stats)
+        nlp = models.get('spacy')
         if not nlp:
-            # Fallback keyword extraction
-            words = re.findall(r'\b[a-zA-Z]{3,}\b', text.lower())
-            return list(set(words))[:10]
-        
-        doc = nlp(text)
-        keywords = []
-        
-        # Extract named entities
-        for ent in doc.ents:
-            if ent.label_ in ['PERSON', 'PLACE', 'EVENT', 'WORK_OF_ART']:
-                keywords.append(ent.text.lower())
-        
-        # Extract important nouns and adjectives
-        for token in doc:
-            if (token.pos_ in ['NOUN', 'ADJ'] and 
-                not token.is_stop and 
-                not token.is_punct and 
-                len(token.text) > 2):
-                keywords.append(token.lemma_.lower())
-        
-        # Remove duplicates and limit to top 10
-        return list(set(keywords))[:10]
+            return self._unavailable('keywords', SPACY_MODEL, texts, regex_keywords, strict)
+
+        def compute(misses):
+            with observe_model('spacy', len(misses)):
+                candidates = [candidates_from_doc(doc) for doc in nlp.pipe(misses, batch_size=MODEL_BATCH_SIZE)]
+            keywords = [rank_keywords(terms, keyword_stats) for terms in candidates]
+            for text, terms in zip(misses, candidates):
+                keyword_stats.observe(terms, text)
+            return keywords
+
+        return self._isolated('keywords', texts, lambda batch: self._cached('keywords', SPACY_MODEL, batch, compute),
+                              regex_keywords, strict)
     
+    @timed_stage('emotions')
     def analyze_emotions(self, text: str) -> List[Dict]:
         """Analyze emotions in the text"""
-        if not emotion_classifier:
-            # Fallback emotion analysis
-            return [
-                {"emotion": "neutral", "intensity": 50, "color": "#6B7280"}
-            ]
-        
-        try:
-            results = emotion_classifier(text)
-            emotions = []
-            
-            for result in results[:5]:  # Top 5 emotions
-                emotion = result['label'].lower()
-                intensity = int(result['score'] * 100)
-                color = self.emotion_colors.get(emotion, '#6B7280')
-                
-                emotions.append({
-                    "emotion": emotion,
-                    "intensity": intensity,
-                    "color": color
+        return self.score_emotions(text)['profile']
+
+    @timed_stage('emotions_batch')
+    def analyze_emotions_batch(self, texts: List[str]) -> List[List[Dict]]:
+        """Analyze emotions for many texts in one classifier call"""
+        return [scores['profile'] for scores in self.score_emotions_batch(texts)]
+
+    def score_emotions(self, text: str) -> Dict[str, List[Dict]]:
+        """Length-weighted emotion profile of the text plus the top emotion of each sentence window"""
+        return self.score_emotions_batch([text])[0]
+
+    @timed_stage('emotion_windows')
+    def score_emotions_batch(self, texts: List[str], strict: bool = False) -> List[Dict[str, List[Dict]]]:
+        """Score the sentence windows of many texts in one batched classifier pass"""
+        neutral = lambda text: self._neutral_emotions()
+        if not models.get('emotion_classifier'):
+            return self._unavailable('emotions', EMOTION_MODEL, texts, neutral, strict)
+
+        def compute(misses):
+            windows_per_text, distributions_per_text = self._score_windows('emotion_window', EMOTION_MODEL,
+                                                                           emotion_batcher, misses)
+            results = []
+            for windows, distributions in zip(windows_per_text, distributions_per_text):
+                profile = self._aggregate_distributions(distributions, [weight for _, weight in windows])
+                results.append({
+                    'profile': self._format_emotions(profile),
+                    'windows': [{'text': window, **self._format_emotions(distribution)[0]}
+                                for (window, _), distribution in zip(windows, distributions)]
                 })
+            return results
+
+        return self._isolated('emotions', texts, lambda batch: self._cached('emotions', EMOTION_MODEL, batch, compute),
+                              neutral, strict)
+
+    def _neutral_emotions(self) -> Dict[str, List[Dict]]:
+        return {'profile': [{"emotion": "neutral", "intensity": 50, "color": "#6B7280"}], 'windows': []}
+
+    def _format_emotions(self, results: List[Dict]) -> List[Dict]:
+        emotions = []
+        
+        for result in results[:5]:  # Top 5 emotions
+            emotion = result['label'].lower()
+            intensity = int(result['score'] * 100)
+            color = self.emotion_colors.get(emotion, '#6B7280')
             
-            return emotions
-            
-        except Exception as e:
-            logger.error(f"Emotion analysis error: {e}")
-            return [{"emotion": "neutral", "intensity": 50, "color": "#6B7280"}]
+            emotions.append({
+                "emotion": emotion,
+                "intensity": intensity,
+                "color": color
+            })
+        
+        return emotions
     
+    @timed_stage('sentiment')
     def analyze_sentiment(self, text: str) -> Dict:
         """Analyze overall sentiment"""
-        if not sentiment_analyzer:
-            return {"sentiment": "neutral", "confidence": 0.5}
-        
-        try:
-            result = sentiment_analyzer(text)[0]
-            return {
-                "sentiment": result['label'].lower(),
-                "confidence": result['score']
-            }
-        except Exception as e:
-            logger.error(f"Sentiment analysis error: {e}")
-            return {"sentiment": "neutral", "confidence": 0.5}
+        return self.score_sentiment(text)['overall']
+
+    @timed_stage('sentiment_batch')
+    def analyze_sentiment_batch(self, texts: List[str]) -> List[Dict]:
+        """Analyze sentiment for many texts in one pipeline call"""
+        return [scores['overall'] for scores in self.score_sentiment_batch(texts)]
+
+    def score_sentiment(self, text: str) -> Dict[str, Any]:
+        """Length-weighted overall sentiment of the text plus the sentiment of each sentence window"""
+        return self.score_sentiment_batch([text])[0]
+
+    @timed_stage('sentiment_windows')
+    def score_sentiment_batch(self, texts: List[str], strict: bool = False) -> List[Dict[str, Any]]:
+        """Score the sentence windows of many texts in one batched pipeline pass"""
+        neutral = lambda text: self._neutral_sentiment()
+        if not models.get('sentiment_analyzer'):
+            return self._unavailable('sentiment', SENTIMENT_MODEL, texts, neutral, strict)
+
+        def compute(misses):
+            windows_per_text, distributions_per_text = self._score_windows('sentiment_window', SENTIMENT_MODEL,
+                                                                           sentiment_batcher, misses)
+            results = []
+            for windows, distributions in zip(windows_per_text, distributions_per_text):
+                overall = self._aggregate_distributions(distributions, [weight for _, weight in windows])
+                results.append({
+                    'overall': self._format_sentiment(overall[0]),
+                    'windows': [self._format_sentiment(distribution[0]) for distribution in distributions]
+                })
+            return results
+
+        return self._isolated('sentiment', texts, lambda batch: self._cached('sentiment', SENTIMENT_MODEL, batch, compute),
+                              neutral, strict)
+
+    def _neutral_sentiment(self) -> Dict[str, Any]:
+        return {'overall': {"sentiment": "neutral", "confidence": 0.5}, 'windows': []}
+
+    def _format_sentiment(self, result: Dict) -> Dict:
+        return {
+            "sentiment": result['label'].lower(),
+            "confidence": result['score']
+        }
+
+    def _score_windows(self, stage: str, model: str, batcher, texts: List[str]) -> tuple:
+        """Split each text into windows and classify the ones not in the sentence cache in one batched call.
+
+        Returns the (window, weight) pairs and the label distributions per text.
+        """
+        windows_per_text = [self._sentence_windows(text) for text in texts]
+        flat = [window for windows in windows_per_text for window, _ in windows]
+        outputs = self._cached(stage, model, flat, lambda misses: list(batcher.submit(misses)), cache=sentence_cache)
+
+        distributions_per_text = []
+        offset = 0
+        for windows in windows_per_text:
+            distributions_per_text.append(list(outputs[offset:offset + len(windows)]))
+            offset += len(windows)
+        return windows_per_text, distributions_per_text
+
+    def _sentence_windows(self, text: str) -> List[tuple]:
+        """(window, word count) pairs: one per sentence, splitting long sentences and merging when there are too many"""
+        windows = []
+        for sentence in nltk.sent_tokenize(text) or [text]:
+            words = sentence.split()
+            for j in range(0, max(1, len(words)), WINDOW_MAX_WORDS):
+                windows.append(' '.join(words[j:j + WINDOW_MAX_WORDS]) or sentence)
+
+        if len(windows) > MAX_WINDOWS:
+            # Pack neighbouring sentences into windows of up to WINDOW_MAX_WORDS words, at stable boundaries
+            groups = _stable_groups(windows, [len(window.split()) for window in windows],
+                                    WINDOW_MAX_WORDS, WINDOW_PACK_SENTENCES)
+            windows = [' '.join(windows[i] for i in group) for group in groups]
+        if len(windows) > MAX_WINDOWS:
+            # Beyond MAX_WINDOWS * WINDOW_MAX_WORDS words, merge evenly; the model truncates each window
+            group = -(-len(windows) // MAX_WINDOWS)
+            windows = [' '.join(windows[j:j + group]) for j in range(0, len(windows), group)]
+        return [(window, max(1, len(window.split()))) for window in windows]
+
+    def _aggregate_distributions(self, distributions: List[List[Dict]], weights: List[int]) -> List[Dict]:
+        """Weighted mean of per-window label distributions, sorted by score"""
+        totals = {}
+        for distribution, weight in zip(distributions, weights):
+            for result in distribution:
+                totals[result['label']] = totals.get(result['label'], 0.0) + result['score'] * weight
+        total_weight = float(sum(weights)) or 1.0
+        return sorted(({'label': label, 'score': score / total_weight} for label, score in totals.items()),
+                      key=lambda result: result['score'], reverse=True)
     
+    @timed_stage('themes_and_symbols')
     def analyze_themes_and_symbols_semantic(self, text: str, threshold=0.4) -> Dict[str, List[Dict[str, Any]]]:
         """Analyze themes and symbols using semantic similarity."""
-        if not sentence_transformer:
+        if not models.get('lexicon_index'):
+            fallback('themes_and_symbols', 'model_unavailable')
             return {"themes": [], "symbols": []}
 
-        sentences = nltk.sent_tokenize(text)
-        sentence_embeddings = sentence_transformer.encode(sentences, convert_to_tensor=True)
-
-        # Analyze Themes
-        theme_hits = util.semantic_search(sentence_embeddings, self.theme_embeddings, top_k=1)
-        detected_themes = {}
-        for i, hits in enumerate(theme_hits):
-            if hits and hits[0]['score'] > threshold:
-                theme_index = hits[0]['corpus_id']
-                theme_name = list(self.themes.keys())[theme_index]
-                if theme_name not in detected_themes or hits[0]['score'] > detected_themes[theme_name]['score']:
-                    detected_themes[theme_name] = {
-                        'theme': theme_name,
-                        'meaning': list(self.themes.values())[theme_index],
-                        'score': hits[0]['score'],
-                        'sentence': sentences[i]
-                    }
-        
-        # Analyze Symbols
-        symbol_hits = util.semantic_search(sentence_embeddings, self.symbol_embeddings, top_k=1)
-        detected_symbols = {}
-        for i, hits in enumerate(symbol_hits):
-            if hits and hits[0]['score'] > threshold:
-                symbol_index = hits[0]['corpus_id']
-                symbol_name = list(self.symbols.keys())[symbol_index]
-                if symbol_name not in detected_symbols or hits[0]['score'] > detected_symbols[symbol_name]['score']:
-                    detected_symbols[symbol_name] = {
-                        'symbol': symbol_name,
-                        'meaning': list(self.symbols.values())[symbol_index],
-                        'score': hits[0]['score'],
-                        'sentence': sentences[i]
-                    }
+        def compute(misses):
+            sentences = nltk.sent_tokenize(misses[0])
+            sentence_embeddings = self._sentence_embeddings(sentences)
+            self._remember_dream_embedding(misses[0], sentence_embeddings)
+            return [self._match_themes_and_symbols(sentences, sentence_embeddings, threshold)]
 
-        return {
-            "themes": sorted(list(detected_themes.values()), key=lambda x: x['score'], reverse=True)[:5],
-            "symbols": sorted(list(detected_symbols.values()), key=lambda x: x['score'], reverse=True)[:5]
-        }
+        return self._cached(f'semantic:{threshold}:{self.lexicon.version}', SENTENCE_MODEL, [text], compute)[0]
+
+    @timed_stage('themes_and_symbols_batch')
+    def analyze_themes_and_symbols_semantic_batch(self, texts: List[str], threshold=0.4,
+                                                  strict: bool = False) -> List[Dict[str, List[Dict[str, Any]]]]:
+        """Analyze themes and symbols for many texts with one encode call across all sentences."""
+        empty = lambda text: {"themes": [], "symbols": []}
+        if not models.get('lexicon_index'):
+            return self._unavailable('themes_and_symbols', SENTENCE_MODEL, texts, empty, strict)
+
+        def compute(misses):
+            sentences_per_text = [nltk.sent_tokenize(text) for text in misses]
+            all_sentences = [sentence for sentences in sentences_per_text for sentence in sentences]
+            all_embeddings = self._sentence_embeddings(all_sentences)
+
+            results = []
+            offset = 0
+            for text, sentences in zip(misses, sentences_per_text):
+                embeddings = all_embeddings[offset:offset + len(sentences)]
+                offset += len(sentences)
+                self._remember_dream_embedding(text, embeddings)
+                results.append(self._match_themes_and_symbols(sentences, embeddings, threshold))
+            return results
+
+        stage = f'semantic:{threshold}:{self.lexicon.version}'
+        return self._isolated('themes_and_symbols', texts,
+                              lambda batch: self._cached(stage, SENTENCE_MODEL, batch, compute), empty, strict)
+
+    @timed_stage('dream_embedding')
+    def dream_embedding(self, text: str) -> List[float]:
+        """Dream-level embedding: the normalized mean of its sentence embeddings"""
+        return self.dream_embeddings_batch([text])[0]
+
+    @timed_stage('dream_embedding_batch')
+    def dream_embeddings_batch(self, texts: List[str]) -> List[List[float]]:
+        """Dream-level embeddings for many texts, reusing the ones the semantic stage already computed"""
+        if not models.get('sentence_transformer'):
+            raise RuntimeError('sentence_transformer is not available')
+
+        def compute(misses):
+            sentences_per_text = [nltk.sent_tokenize(text) or [text] for text in misses]
+            all_sentences = [sentence for sentences in sentences_per_text for sentence in sentences]
+            all_embeddings = self._sentence_embeddings(all_sentences)
 
+            results = []
+            offset = 0
+            for sentences in sentences_per_text:
+                results.append(self._pool(all_embeddings[offset:offset + len(sentences)]))
+                offset += len(sentences)
+            return results
+
+        return self._cached('dream_embedding', SENTENCE_MODEL, texts, compute)
+
+    def _pool(self, sentence_embeddings) -> List[float]:
+        pooled = np.asarray(sentence_embeddings, dtype=np.float32).mean(axis=0)
+        norm = np.linalg.norm(pooled)
+        return (pooled / norm if norm else pooled).tolist()
+
+    def _sentence_embeddings(self, sentences: List[str]):
+        """Normalized embeddings of the sentences, encoding only the ones not in the sentence cache"""
+        if not sentences:
+            return np.zeros((0, 0), dtype=np.float32)
+        packed = self._cached('sentence_embedding', SENTENCE_MODEL, sentences,
+                              lambda misses: [pack_vector(vector) for vector in encode_batcher.submit(misses)],
+                              cache=sentence_cache)
+        return np.stack([unpack_vector(value) for value in packed])
+
+    def _remember_dream_embedding(self, text: str, sentence_embeddings):
+        if len(sentence_embeddings):
+            key = result_cache.key('dream_embedding', text, f'{SENTENCE_MODEL}@{model_backend(SENTENCE_MODEL)}', ANALYZER_VERSION)
+            result_cache.set('dream_embedding', key, self._pool(sentence_embeddings))
+
+    def _match_themes_and_symbols(self, sentences: List[str], sentence_embeddings, threshold: float) -> Dict[str, List[Dict[str, Any]]]:
+        if not sentences:
+            return {"themes": [], "symbols": []}
+        return self.lexicon.match(sentences, sentence_embeddings, threshold)
+
+    @timed_stage('summary')
     def generate_summary(self, text: str) -> str:
         """Generate a psychological summary of the dream"""
-        if not summarizer or len(text) < 100:
-            # Fallback summary generation
-            return f"This dream reflects subconscious thoughts and emotions. The imagery suggests themes of personal growth and inner exploration."
-        
-        try:
-            # Truncate text if too long for the model
-            max_length = 1024
-            if len(text) > max_length:
-                text = text[:max_length]
-            
-            summary = summarizer(text, max_length=150, min_length=50, do_sample=False)
-            return summary[0]['summary_text']
-            
-        except Exception as e:
-            logger.error(f"Summary generation error: {e}")
-            return "This dream contains rich symbolic content that reflects your subconscious mind's processing of daily experiences and deeper psychological themes."
+        return self.generate_summary_batch([text])[0]
+
+    @timed_stage('summary_batch')
+    def generate_summary_batch(self, texts: List[str], strict: bool = False) -> List[str]:
+        """Summarize many dreams, sending the long enough ones to the summarizer together"""
+        # Fallback summary generation
+        summaries = ["This dream reflects subconscious thoughts and emotions. The imagery suggests themes of personal growth and inner exploration."] * len(texts)
+        indices = [i for i, text in enumerate(texts) if len(text) >= 100]
+        if len(indices) < len(texts):
+            fallback('summary', 'short_input')
+        if not indices:
+            return summaries
+
+        summarizer = models.get('summarizer')
+        if not summarizer:
+            unavailable = self._unavailable('summary', SUMMARY_MODEL, [texts[i] for i in indices],
+                                            lambda text: summaries[0], strict)
+            for i, summary in zip(indices, unavailable):
+                summaries[i] = summary
+            return summaries
+
+        def compute(misses):
+            if SUMMARY_MODE == 'truncate':
+                # Truncate text if too long for the model
+                max_length = 1024
+                inputs = [text[:max_length] for text in misses]
+                results = _summarize(inputs, max_length=150, min_length=50, do_sample=False)
+                return [result['summary_text'] for result in results]
+            return self._map_reduce_summaries(summarizer, misses)
+
+        results = self._isolated(
+            'summary', [texts[i] for i in indices],
+            lambda batch: self._cached(f'summary:{SUMMARY_MODE}', SUMMARY_MODEL, batch, compute),
+            lambda text: "This dream contains rich symbolic content that reflects your subconscious mind's processing of daily experiences and deeper psychological themes.",
+            strict
+        )
+        for i, summary in zip(indices, results):
+            summaries[i] = summary
+        return summaries
+
+    def _map_reduce_summaries(self, summarizer, texts: List[str]) -> List[str]:
+        """Summarize whole texts: summarize token-budgeted chunks, then summarize the partial summaries."""
+        tokenizer = summarizer.tokenizer
+        pending = {i: self._chunk_for_summary(text, tokenizer) for i, text in enumerate(texts)}
+        summaries = [''] * len(texts)
+
+        while pending:
+            # Map: every chunk of every pending text goes through the summarizer together
+            chunks = [(i, chunk) for i, text_chunks in pending.items() for chunk in text_chunks]
+            partials = self._summarize_chunks([chunk for _, chunk in chunks])
+
+            grouped = {}
+            for (i, _), partial in zip(chunks, partials):
+                grouped.setdefault(i, []).append(partial)
+
+            # Reduce: texts with several partial summaries get summarized again
+            pending = {}
+            for i, parts in grouped.items():
+                if len(parts) == 1:
+                    summaries[i] = parts[0]
+                else:
+                    pending[i] = self._chunk_for_summary(' '.join(parts), tokenizer)
+                    if len(pending[i]) >= len(parts):
+                        # Partials did not shrink; stop rather than loop
+                        summaries[i] = ' '.join(parts)
+                        del pending[i]
+        return summaries
+
+    def _chunk_for_summary(self, text: str, tokenizer) -> List[tuple]:
+        """Split text into (chunk, n_tokens) pairs of at most SUMMARY_CHUNK_TOKENS tokens at stable sentence boundaries."""
+        pieces = []
+        for sentence in nltk.sent_tokenize(text):
+            ids = tokenizer.encode(sentence, add_special_tokens=False)
+            if len(ids) > SUMMARY_CHUNK_TOKENS:
+                # A single sentence over budget is split on token boundaries
+                pieces.extend((tokenizer.decode(ids[j:j + SUMMARY_CHUNK_TOKENS]), len(ids[j:j + SUMMARY_CHUNK_TOKENS]))
+                              for j in range(0, len(ids), SUMMARY_CHUNK_TOKENS))
+            else:
+                pieces.append((sentence, len(ids)))
+        groups = _stable_groups([piece for piece, _ in pieces], [n_tokens for _, n_tokens in pieces],
+                                SUMMARY_CHUNK_TOKENS, SUMMARY_CHUNK_SENTENCES)
+        return [(' '.join(pieces[i][0] for i in group), sum(pieces[i][1] for i in group)) for group in groups]
+
+    def _summarize_chunks(self, chunks: List[tuple]) -> List[str]:
+        """Summarize (text, n_tokens) chunks not in the sentence cache, one batched call per generation-length bucket."""
+        n_tokens = {chunk: tokens for chunk, tokens in chunks}
+
+        def compute(misses):
+            buckets = {}
+            for index, chunk in enumerate(misses):
+                # Bound generation length by input size, in steps of 16 tokens to keep buckets few
+                max_length = max(16, min(150, (n_tokens[chunk] // 2 + 15) // 16 * 16))
+                min_length = min(50, max_length // 2)
+                buckets.setdefault((max_length, min_length), []).append(index)
+
+            results = [''] * len(misses)
+            for (max_length, min_length), indices in buckets.items():
+                inputs = [misses[i] for i in indices]
+                outputs = _summarize(inputs, max_length=max_length, min_length=min_length,
+                                     do_sample=False, truncation=True)
+                for i, output in zip(indices, outputs):
+                    results[i] = output['summary_text']
+            return results
+
+        return self._cached('summary_chunk', SUMMARY_MODEL, [chunk for chunk, _ in chunks], compute, cache=sentence_cache)
+
+    @timed_stage('lite')
+    def analyze_lite(self, text: str, threshold=0.4) -> Dict[str, Any]:
+        """Model-free analysis: word-lexicon emotions, sentiment, themes and symbols, and an extractive summary"""
+        windows = self._sentence_windows(text)
+        sentences = [window for window, _ in windows]
+        scores = self.word_lexicon.score(sentences)
+        weights = [weight for _, weight in windows]
+
+        emotion_scores = {
+            'profile': self._format_emotions(self._aggregate_distributions(scores['emotions'], weights)),
+            'windows': [{'text': window, **self._format_emotions(distribution)[0]}
+                        for window, distribution in zip(sentences, scores['emotions'])]
+        }
+        sentiment_scores = {
+            'overall': self._format_sentiment(self._aggregate_distributions(scores['sentiment'], weights)[0]),
+            'windows': [self._format_sentiment(distribution[0]) for distribution in scores['sentiment']]
+        }
+        semantic_analysis = self.lexicon.select(sentences, scores['entries'], threshold)
+        keywords = rank_keywords(candidates_from_text(text), keyword_stats)
+        # Windows of a long dream are packed sentence groups, so the summary picks from single sentences
+        summary_sentences = nltk.sent_tokenize(text) or [text]
+        summary = extractive_summary(summary_sentences, self.word_lexicon.score(summary_sentences)['salience'])
+        return compile_analysis(keywords, emotion_scores, sentiment_scores, semantic_analysis, summary)
+
+def build_insights(emotions: List[Dict], themes: List[Dict[str, Any]]) -> Dict[str, str]:
+    """Psychological insights and advice derived from the emotion and theme stages"""
+    return {
+        'psychological_insights': f"This dream reveals important aspects of your subconscious mind. The dominant emotions of {', '.join([e['emotion'] for e in emotions[:2]])} suggest you're processing {themes[0]['theme'] if themes else 'personal experiences'}.",
+        'actionable_advice': "Consider journaling about the emotions and symbols in this dream. They may provide insights into your current life situation and inner desires."
+    }
+
+def build_emotional_arc(emotion_scores: Dict[str, List[Dict]], sentiment_scores: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Per-window emotion and sentiment, in reading order"""
+    arc = []
+    for index, window in enumerate(emotion_scores['windows']):
+        point = {'index': index, **window}
+        if index < len(sentiment_scores['windows']):
+            sentiment = sentiment_scores['windows'][index]
+            point.update({'sentiment': sentiment['sentiment'], 'sentiment_confidence': sentiment['confidence']})
+        arc.append(point)
+    return arc
+
+def compile_analysis(keywords: List[str], emotion_scores: Dict[str, List[Dict]], sentiment_scores: Dict[str, Any],
+                     semantic_analysis: Dict[str, List[Dict[str, Any]]], summary: str) -> Dict[str, Any]:
+    """Assemble the /analyze response body from the individual stage results"""
+    emotions = emotion_scores['profile']
+    themes = semantic_analysis['themes']
+    symbols = semantic_analysis['symbols']
+    return {
+        'keywords': keywords,
+        'emotions': emotions,
+        'sentiment': sentiment_scores['overall'],
+        'emotional_arc': build_emotional_arc(emotion_scores, sentiment_scores),
+        'themes': [t['theme'] for t in themes], # Keep original structure if needed
+        'symbols': symbols,
+        'summary': summary,
+        **build_insights(emotions, themes)
+    }
 
 # Initialize analyzer
 dream_analyzer = DreamAnalyzer()
 
+def analyze_contents(contents: List[str]) -> List[tuple]:
+    """Full analysis of many dreams, each stage batched across all of them.
+
+    Returns an (analysis, error) pair per dream; error is None on success. A dream
+    any stage failed for (or whose model is unavailable) gets an error rather than
+    fallback results, so callers never store placeholder analyses.
+    """
+    keywords = dream_analyzer.extract_keywords_batch(contents, strict=True)
+    emotions = dream_analyzer.score_emotions_batch(contents, strict=True)
+    sentiments = dream_analyzer.score_sentiment_batch(contents, strict=True)
+    semantic = dream_analyzer.analyze_themes_and_symbols_semantic_batch(contents, strict=True)
+    summaries = dream_analyzer.generate_summary_batch(contents, strict=True)
+    
+    results = []
+    for i in range(len(contents)):
+        stages = (keywords[i], emotions[i], sentiments[i], semantic[i], summaries[i])
+        error = next((stage for stage in stages if isinstance(stage, Exception)), None)
+        if error is not None:
+            results.append((None, error))
+            continue
+        try:
+            results.append((compile_analysis(*stages), None))
+        except Exception as e:
+            results.append((None, e))
+    return results
+
+# Per-user dream embeddings for /similar-dreams
+vector_store = DreamVectorStore(vector_store_dir())
+
+def index_dream(user_id: str, dream_id: str, content: str, title: str = None) -> bool:
+    """Add or refresh a dream in its owner's vector index; failures are logged, not raised"""
+    try:
+        vector_store.upsert(user_id, dream_id, dream_analyzer.dream_embedding(content), title)
+        return True
+    except Exception as e:
+        logger.error(f"Dream indexing error for {dream_id}: {e}")
+        return False
+
+# Runs the independent analysis stages of a streamed request concurrently
+stage_executor = ThreadPoolExecutor(max_workers=int(os.getenv('NLP_STREAM_WORKERS', 8)), thread_name_prefix='stage')
+
+# Preload models at import time (e.g. in the gunicorn master with preload_app,
+# so forked workers share the weights copy-on-write)
+_preload = os.getenv('NLP_PRELOAD_MODELS', '').strip()
+if _preload:
+    models.warmup(None if _preload == 'all' else [m.strip() for m in _preload.split(',') if m.strip()])
+
+def _model_metrics():
+    status = models.status()
+    yield '# HELP nlp_model_loaded Whether a model is loaded (1) or not (0).'
+    yield '# TYPE nlp_model_loaded gauge'
+    for name, info in status.items():
+        yield f'nlp_model_loaded{{model="{name}"}} {1 if info["state"] == "loaded" else 0}'
+    yield '# HELP nlp_model_load_seconds Time the last load of a model took.'
+    yield '# TYPE nlp_model_load_seconds gauge'
+    for name, info in status.items():
+        if info['load_seconds'] is not None:
+            yield f'nlp_model_load_seconds{{model="{name}"}} {info["load_seconds"]}'
+
+def _cache_metrics():
+    caches = {'result': result_cache.stats(), 'sentence': sentence_cache.stats()}
+    for outcome in ('hits', 'misses'):
+        yield f'# HELP nlp_cache_{outcome}_total Result cache {outcome} per stage.'
+        yield f'# TYPE nlp_cache_{outcome}_total counter'
+        for cache, stats in caches.items():
+            for stage, counts in stats['stages'].items():
+                yield f'nlp_cache_{outcome}_total{{cache="{cache}",stage="{stage}"}} {counts[outcome]}'
+    yield '# HELP nlp_cache_entries Entries in the in-memory result cache.'
+    yield '# TYPE nlp_cache_entries gauge'
+    for cache, stats in caches.items():
+        yield f'nlp_cache_entries{{cache="{cache}"}} {stats["entries"]}'
+
+REGISTRY.add_collector(_model_metrics)
+REGISTRY.add_collector(_cache_metrics)
+
+@app.before_request
+def _start_request_metrics():
+    request.environ['nlp.started'] = time.perf_counter()
+    start_request_timings()
+    REQUESTS_IN_FLIGHT.labels(endpoint=request.endpoint or 'unknown').inc()
+
+@app.teardown_request
+def _finish_request_metrics(exc=None):
+    started = request.environ.pop('nlp.started', None)
+    if started is None:
+        return
+    endpoint = request.endpoint or 'unknown'
+    REQUESTS_IN_FLIGHT.labels(endpoint=endpoint).dec()
+    status = request.environ.get('nlp.status', 500 if exc else 200)
+    REQUEST_SECONDS.labels(endpoint=endpoint, status=status).observe(time.perf_counter() - started)
+
+@app.after_request
+def _record_status(response):
+    request.environ['nlp.status'] = response.status_code
+    return response
+
+def inference_endpoint(view):
+    """Run the view inside an inference slot, shedding load and enforcing the request deadline."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        deadline = deadline_from_headers(request.headers, REQUEST_TIMEOUT_SECONDS)
+        try:
+            with inference_gate.slot(deadline):
+                response = app.make_response(view(*args, **kwargs))
+        except (Overloaded, DeadlineExceeded) as e:
+            return load_shed_response(e)
+        
+        # Stages stop early once the deadline passes; report that as a timeout, not a failure
+        if response.status_code >= 500 and deadline_expired(deadline):
+            return jsonify({'error': 'Deadline exceeded', 'message': 'request deadline exceeded'}), 504
+        return response
+    return wrapper
+
+def load_shed_response(error: Exception):
+    """503 with Retry-After when the gate is full, 504 when the deadline passed before a slot freed up."""
+    if isinstance(error, Overloaded):
+        return jsonify({
+            'error': 'Server busy',
+            'retry_after': error.retry_after
+        }), 503, {'Retry-After': str(error.retry_after)}
+    return jsonify({'error': 'Deadline exceeded', 'message': str(error)}), 504
+
+def _gate_metrics():
+    stats = inference_gate.stats()
+    yield '# HELP nlp_inference_active Requests holding an inference slot.'
+    yield '# TYPE nlp_inference_active gauge'
+    yield f'nlp_inference_active {stats["active"]}'
+    yield '# HELP nlp_inference_waiting Requests queued for an inference slot.'
+    yield '# TYPE nlp_inference_waiting gauge'
+    yield f'nlp_inference_waiting {stats["waiting"]}'
+
+REGISTRY.add_collector(_gate_metrics)
+
+def request_object() -> Optional[Dict[str, Any]]:
+    """The request's JSON body if it is an object; None when it is missing, malformed or another JSON type"""
+    data = request.get_json(silent=True)
+    return data if isinstance(data, dict) else None
+
+def invalid_body():
+    return jsonify({'error': 'A JSON object is required'}), 400
+
+def processing_metadata(started: float = None) -> Dict[str, Any]:
+    """Elapsed time of the current request and its per-stage breakdown, in milliseconds"""
+    started = started or request.environ.get('nlp.started')
+    return {
+        'processing_time_ms': round((time.perf_counter() - started) * 1000, 3) if started else None,
+        'stage_timings_ms': request_timings()
+    }
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({
         'status': 'OK',
         'timestamp': datetime.now().isoformat(),
         'models_loaded': {
-            'spacy': nlp is not None,
-            'emotion_classifier': emotion_classifier is not None,
-            'sentiment_analyzer': sentiment_analyzer is not None,
-            'summarizer': summarizer is not None
-        }
+            'spacy': models.is_loaded('spacy'),
+            'emotion_classifier': models.is_loaded('emotion_classifier'),
+            'sentiment_analyzer': models.is_loaded('sentiment_analyzer'),
+            'summarizer': models.is_loaded('summarizer')
+        },
+        'models': models.status(),
+        'inference_backend': effective_backend(),
+        'inference_backend_requested': INFERENCE_BACKEND,
+        'model_backends': dict(MODEL_BACKENDS),
+        'inference': inference_gate.stats(),
+        'inference_workers': inference_workers.stats(),
+        'cache': result_cache.stats(),
+        'sentence_cache': sentence_cache.stats(),
+        'keyword_stats': keyword_stats.stats()
+    })
+
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    required = [m.strip() for m in os.getenv('NLP_READY_MODELS', ','.join(models.names())).split(',') if m.strip()]
+    status = models.status()
+    pending = [name for name in required if status.get(name, {}).get('state') != 'loaded']
+    return jsonify({
+        'ready': not pending,
+        'pending': pending,
+        'models': status
+    }), 200 if not pending else 503
+
+@app.route('/warmup', methods=['POST'])
+def warmup():
+    # An empty body warms every model
+    data = request_object() if request.get_data() else {}
+    if data is None:
+        return invalid_body()
+    names = data.get('models')
+    status = models.warmup(names)
+    return jsonify({
+        'success': all(status[name]['state'] == 'loaded' for name in (names or status) if name in status),
+        'models': status
     })
 
 @app.route('/analyze', methods=['POST'])
 def analyze_dream():
+    data = request_object()
+    if data is None:
+        return invalid_body()
+    tier = data.get('tier') or DEFAULT_TIER
+    if tier not in ANALYSIS_TIERS:
+        return jsonify({'error': f"Unknown tier {tier!r} (expected one of {', '.join(ANALYSIS_TIERS)})"}), 400
+    # The lite tier loads no model, so it neither takes an inference slot nor waits for one
+    return analyze_dream_lite(data) if tier == 'lite' else analyze_dream_full(data)
+
+def analyze_dream_lite(data: Dict[str, Any]):
+    if not isinstance(data.get('content'), str):
+        return jsonify({'error': 'Dream content is required'}), 400
+    content = data['content']
+    if len(content) < 10:
+        return jsonify({'error': 'Dream content too short'}), 400
+
     try:
-        data = request.get_json()
-        
-        if not data or 'content' not in data:
+        analysis = dream_analyzer.analyze_lite(content)
+    except Exception as e:
+        logger.error(f"Lite dream analysis error: {e}")
+        return jsonify({'error': 'Analysis failed', 'message': str(e)}), 500
+
+    return jsonify({
+        'success': True,
+        'analysis': analysis,
+        'metadata': {
+            'processed_at': datetime.now().isoformat(),
+            'content_length': len(content),
+            'tier': 'lite',
+            **processing_metadata(),
+            # Indexing needs the sentence model; use the full tier or /index-dream
+            'indexed': False
+        }
+    })
+
+@inference_endpoint
+def analyze_dream_full(data: Dict[str, Any]):
+    try:
+        if not isinstance(data.get('content'), str):
             return jsonify({'error': 'Dream content is required'}), 400
         
         content = data['content']
@@ -269,24 +996,18 @@ def analyze_dream():
         
         # Perform comprehensive analysis
         keywords = dream_analyzer.extract_keywords(content)
-        emotions = dream_analyzer.analyze_emotions(content)
-        sentiment = dream_analyzer.analyze_sentiment(content)
+        emotions = dream_analyzer.score_emotions(content)
+        sentiment = dream_analyzer.score_sentiment(content)
         semantic_analysis = dream_analyzer.analyze_themes_and_symbols_semantic(content)
-        themes = semantic_analysis['themes']
-        symbols = semantic_analysis['symbols']
         summary = dream_analyzer.generate_summary(content)
         
         # Compile analysis results
-        analysis = {
-            'keywords': keywords,
-            'emotions': emotions,
-            'sentiment': sentiment,
-            'themes': [t['theme'] for t in themes], # Keep original structure if needed
-            'symbols': symbols,
-            'summary': summary,
-            'psychological_insights': f"This dream reveals important aspects of your subconscious mind. The dominant emotions of {', '.join([e['emotion'] for e in emotions[:2]])} suggest you're processing {themes[0]['theme'] if themes else 'personal experiences'}.",
-            'actionable_advice': "Consider journaling about the emotions and symbols in this dream. They may provide insights into your current life situation and inner desires."
-        }
+        analysis = compile_analysis(keywords, emotions, sentiment, semantic_analysis, summary)
+        
+        # Keep the dream's embedding for /similar-dreams when the caller identifies it
+        indexed = False
+        if data.get('user_id') and data.get('dream_id'):
+            indexed = index_dream(data['user_id'], data['dream_id'], content, title)
         
         logger.info(f"Dream analysis completed: {len(content)} characters processed")
         
@@ -296,7 +1017,9 @@ def analyze_dream():
             'metadata': {
                 'processed_at': datetime.now().isoformat(),
                 'content_length': len(content),
-                'processing_time': 'real-time'
+                'tier': 'full',
+                **processing_metadata(),
+                'indexed': indexed
             }
         })
         
@@ -307,13 +1030,297 @@ def analyze_dream():
             'message': str(e)
         }), 500
 
+@app.route('/analyze-stream', methods=['POST'])
+def analyze_dream_stream():
+    """Stream each analysis stage as soon as it finishes (NDJSON, or SSE with Accept: text/event-stream)"""
+    data = request_object()
+    
+    if data is None or not isinstance(data.get('content'), str):
+        return jsonify({'error': 'Dream content is required'}), 400
+    
+    content = data['content']
+    
+    if len(content) < 10:
+        return jsonify({'error': 'Dream content too short'}), 400
+    
+    use_sse = 'text/event-stream' in request.headers.get('Accept', '')
+    started = request.environ.get('nlp.started')
+
+    # Take the inference slot before the response starts; it is released when the stream is closed
+    deadline = deadline_from_headers(request.headers, REQUEST_TIMEOUT_SECONDS)
+    try:
+        inference_gate.acquire(deadline)
+    except (Overloaded, DeadlineExceeded) as e:
+        return load_shed_response(e)
+    
+    def format_event(event: str, payload: Dict[str, Any]) -> str:
+        if use_sse:
+            return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+        return json.dumps({'event': event, **payload}) + "\n"
+    
+    def generate():
+        with deadline_scope(deadline):
+            yield from generate_stages()
+
+    def generate_stages():
+        def submit(fn):
+            # Each stage runs in a copy of the request context so its timing and deadline apply to this request
+            return stage_executor.submit(contextvars.copy_context().run, fn, content)
+        
+        stages = {
+            submit(dream_analyzer.extract_keywords): 'keywords',
+            submit(dream_analyzer.score_emotions): 'emotions',
+            submit(dream_analyzer.score_sentiment): 'sentiment',
+            submit(dream_analyzer.analyze_themes_and_symbols_semantic): 'themes_and_symbols',
+            submit(dream_analyzer.generate_summary): 'summary',
+        }
+        results = {}
+        for future in as_completed(stages):
+            stage = stages[future]
+            try:
+                results[stage] = future.result()
+            except Exception as e:
+                logger.error(f"Streaming {stage} stage error: {e}")
+                yield format_event('error', {'stage': stage, 'message': str(e)})
+                continue
+            
+            if stage == 'themes_and_symbols':
+                yield format_event('themes', {'data': [t['theme'] for t in results[stage]['themes']]})
+                yield format_event('symbols', {'data': results[stage]['symbols']})
+            elif stage == 'emotions':
+                yield format_event(stage, {'data': results[stage]['profile']})
+            elif stage == 'sentiment':
+                yield format_event(stage, {'data': results[stage]['overall']})
+            else:
+                yield format_event(stage, {'data': results[stage]})
+            
+            if stage in ('emotions', 'sentiment') and 'emotions' in results and 'sentiment' in results:
+                yield format_event('emotional_arc', {'data': build_emotional_arc(results['emotions'], results['sentiment'])})
+            
+            # Insights only need emotions and themes, so send them before the summary lands
+            if stage in ('emotions', 'themes_and_symbols') and 'emotions' in results and 'themes_and_symbols' in results:
+                yield format_event('insights', {'data': build_insights(results['emotions']['profile'], results['themes_and_symbols']['themes'])})
+        
+        if len(results) == len(stages):
+            analysis = compile_analysis(results['keywords'], results['emotions'], results['sentiment'],
+                                        results['themes_and_symbols'], results['summary'])
+        else:
+            analysis = None
+        
+        logger.info(f"Streamed dream analysis completed: {len(content)} characters processed")
+        
+        yield format_event('done', {
+            'success': analysis is not None,
+            'analysis': analysis,
+            'metadata': {
+                'processed_at': datetime.now().isoformat(),
+                'content_length': len(content),
+                **processing_metadata(started)
+            }
+        })
+    
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream' if use_sse else 'application/x-ndjson',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+    # Runs once the stream finishes or the client goes away, even if streaming never started
+    response.call_on_close(inference_gate.release)
+    return response
+
+@app.route('/analyze-batch', methods=['POST'])
+@inference_endpoint
+def analyze_batch():
+    try:
+        data = request_object()
+        
+        if data is None or not isinstance(data.get('dreams'), list):
+            return jsonify({'error': 'A list of dreams is required'}), 400
+        
+        dreams = data['dreams']
+        max_items = int(os.getenv('NLP_BATCH_MAX_ITEMS', 500))
+        if len(dreams) > max_items:
+            return jsonify({'error': f'Too many dreams (max {max_items})'}), 400
+        
+        # Validate each item; invalid items are reported without failing the batch
+        results = []
+        valid = []
+        for index, dream in enumerate(dreams):
+            item = dream if isinstance(dream, dict) else {'content': dream}
+            content = item.get('content')
+            result = {'index': index, 'id': item.get('id')}
+            if not isinstance(content, str) or not content:
+                result.update({'success': False, 'error': 'Dream content is required'})
+            elif len(content) < 10:
+                result.update({'success': False, 'error': 'Dream content too short'})
+            else:
+                valid.append((result, content, item))
+            results.append(result)
+        
+        if valid:
+            analyses = analyze_contents([content for _, content, _ in valid])
+            for (result, _, _), (analysis, error) in zip(valid, analyses):
+                if error is None:
+                    result.update({'analysis': analysis, 'success': True})
+                else:
+                    logger.error(f"Batch item {result['index']} analysis error: {error}")
+                    result.update({'success': False, 'error': str(error)})
+            
+            # Index dreams that carry an owner and id (embeddings come from the semantic stage's cache)
+            to_index = [(result, content, item) for result, content, item in valid
+                        if result.get('success') and item.get('user_id') and item.get('id')]
+            if to_index:
+                try:
+                    vectors = dream_analyzer.dream_embeddings_batch([content for _, content, _ in to_index])
+                    for (result, _, item), vector in zip(to_index, vectors):
+                        vector_store.upsert(item['user_id'], item['id'], vector, item.get('title'))
+                        result['indexed'] = True
+                except Exception as e:
+                    logger.error(f"Batch dream indexing error: {e}")
+        
+        logger.info(f"Batch analysis completed: {len(valid)}/{len(dreams)} dreams processed")
+        
+        return jsonify({
+            'success': True,
+            'results': results,
+            'metadata': {
+                'processed_at': datetime.now().isoformat(),
+                'total': len(dreams),
+                'analyzed': sum(1 for r in results if r.get('success')),
+                'failed': sum(1 for r in results if not r.get('success')),
+                **processing_metadata()
+            }
+        })
+        
+    except Exception as e:
+        logger.error(f"Batch analysis error: {e}")
+        return jsonify({
+            'error': 'Batch analysis failed',
+            'message': str(e)
+        }), 500
+
+def _valid_dream_id(dream_id) -> bool:
+    return isinstance(dream_id, str) or (isinstance(dream_id, int) and not isinstance(dream_id, bool))
+
+@app.route('/similar-dreams', methods=['POST'])
+@inference_endpoint
+def similar_dreams():
+    try:
+        data = request_object()
+        if data is None:
+            return invalid_body()
+        user_id = data.get('user_id')
+        dream_id = data.get('dream_id')
+        content = data.get('content')
+        k = data.get('k', 5)
+        
+        if not user_id or not isinstance(user_id, str):
+            return jsonify({'error': 'user_id is required'}), 400
+        if dream_id is not None and not _valid_dream_id(dream_id):
+            return jsonify({'error': 'dream_id must be a string or an integer'}), 400
+        if content is not None and not isinstance(content, str):
+            return jsonify({'error': 'content must be a string'}), 400
+        if isinstance(k, bool) or not isinstance(k, int) or k < 1:
+            return jsonify({'error': 'k must be a positive integer'}), 400
+        k = min(k, 100)
+        
+        vector = vector_store.vector(user_id, dream_id) if dream_id else None
+        if vector is None:
+            if not content or len(content) < 10:
+                return jsonify({'error': 'Dream content or an indexed dream_id is required'}), 400
+            vector = dream_analyzer.dream_embedding(content)
+        
+        return jsonify({
+            'success': True,
+            'similar': vector_store.search(user_id, vector, k=k, exclude=dream_id),
+            'indexed_dreams': vector_store.count(user_id)
+        })
+        
+    except Exception as e:
+        logger.error(f"Similar dreams error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/index-dream', methods=['POST', 'DELETE'])
+@inference_endpoint
+def index_dream_endpoint():
+    data = request_object()
+    if data is None:
+        return invalid_body()
+    user_id = data.get('user_id')
+    dream_id = data.get('dream_id')
+    
+    if not user_id or not dream_id or not isinstance(user_id, str) or not _valid_dream_id(dream_id):
+        return jsonify({'error': 'user_id and dream_id are required'}), 400
+    content = data.get('content', '')
+    if request.method == 'POST' and (not isinstance(content, str) or len(content) < 10):
+        return jsonify({'error': 'Content too short'}), 400
+    
+    try:
+        if request.method == 'DELETE':
+            return jsonify({'success': True, 'removed': vector_store.remove(user_id, dream_id)})
+        
+        if not index_dream(user_id, dream_id, content, data.get('title')):
+            return jsonify({'error': 'Indexing failed'}), 500
+        return jsonify({'success': True, 'indexed_dreams': vector_store.count(user_id)})
+        
+    except Exception as e:
+        logger.error(f"Dream indexing error: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/index-journal', methods=['POST'])
+@inference_endpoint
+def index_journal():
+    """Backfill a user's vector index from their dreams in Supabase.
+
+    Runs in one inference slot under the request deadline, checked between
+    pages; dreams indexed before the deadline stay indexed, so a retry resumes.
+    """
+    try:
+        data = request_object()
+        if data is None:
+            return invalid_body()
+        user_id = data.get('user_id')
+        reindex = bool(data.get('reindex'))
+        
+        if not user_id:
+            return jsonify({'error': 'user_id is required'}), 400
+        if supabase is None:
+            return jsonify({'error': 'Supabase is not configured'}), 503
+        
+        page_size = 200
+        offset = 0
+        indexed = 0
+        while True:
+            check_deadline()
+            rows = supabase.table('dreams').select('id, title, content').eq('user_id', user_id) \
+                .order('created_at').range(offset, offset + page_size - 1).execute().data or []
+            pending = [row for row in rows
+                       if row.get('content') and (reindex or not vector_store.contains(user_id, row['id']))]
+            if pending:
+                vectors = dream_analyzer.dream_embeddings_batch([row['content'] for row in pending])
+                for row, vector in zip(pending, vectors):
+                    vector_store.upsert(user_id, row['id'], vector, row.get('title'))
+                indexed += len(pending)
+            if len(rows) < page_size:
+                break
+            offset += page_size
+        
+        return jsonify({'success': True, 'indexed': indexed, 'indexed_dreams': vector_store.count(user_id)})
+        
+    except Exception as e:
+        logger.error(f"Journal indexing error: {e}")
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/extract-keywords', methods=['POST'])
+@inference_endpoint
 def extract_keywords_endpoint():
     try:
-        data = request.get_json()
+        data = request_object()
+        if data is None:
+            return invalid_body()
         content = data.get('content', '')
         
-        if len(content) < 10:
+        if not isinstance(content, str) or len(content) < 10:
             return jsonify({'error': 'Content too short'}), 400
         
         keywords = dream_analyzer.extract_keywords(content)
@@ -328,12 +1335,15 @@ def extract_keywords_endpoint():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/analyze-emotions', methods=['POST'])
+@inference_endpoint
 def analyze_emotions_endpoint():
     try:
-        data = request.get_json()
+        data = request_object()
+        if data is None:
+            return invalid_body()
         content = data.get('content', '')
         
-        if len(content) < 10:
+        if not isinstance(content, str) or len(content) < 10:
             return jsonify({'error': 'Content too short'}), 400
         
         emotions = dream_analyzer.analyze_emotions(content)
@@ -348,5 +1358,8 @@ def analyze_emotions_endpoint():
         return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
+    # With debug=True the reloader re-runs this script in a child; fork the workers there only
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_inference_workers()
     port = int(os.getenv('PORT', 5000))
     app.run(host='0.0.0.0', port=port, debug=True)
@@ -0,0 +1,144 @@
+import os
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, List, Sequence
+
+from inference_gate import LOAD_SHED, DeadlineExceeded, check_deadline, current_deadline
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """Groups model calls from concurrent requests into a single batched call.
+
+    Callers submit a list of inputs and block until their slice of the batched
+    output is ready. Inputs arriving within `window_ms` of the first pending
+    submission (up to `max_batch_size` inputs) are run through `batch_fn`
+    together; larger submissions are split, so no call exceeds
+    `max_batch_size` inputs. `batch_fn` must return one output per input, in order.
+
+    Up to `concurrency` batches run at once (e.g. one per inference worker
+    process); the next batch is collected while they run. Submissions whose
+    request deadline passes while they wait are dropped before the batch
+    reaches the model.
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Any]], Sequence[Any]], max_batch_size: int = 32,
+                 window_ms: float = 5.0, name: str = 'batcher', concurrency: int = 1):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.window = max(0.0, float(window_ms)) / 1000.0
+        self.name = name
+        self.concurrency = max(1, int(concurrency))
+        self._pending = deque()
+        self._cond = threading.Condition()
+        self._worker = None
+        self._worker_pid = None
+        self._dispatch = None
+        self._slots = None
+
+    def submit(self, items: List[Any]) -> List[Any]:
+        """Run `items` through the model, batched with other callers' items."""
+        items = list(items)
+        if not items:
+            return []
+        check_deadline()
+        slices = [items[i:i + self.max_batch_size] for i in range(0, len(items), self.max_batch_size)]
+        if self.window == 0:
+            return [output for part in slices for output in self.batch_fn(part)]
+
+        futures = [Future() for _ in slices]
+        deadline = current_deadline()
+        with self._cond:
+            self._ensure_worker()
+            self._pending.extend((part, future, deadline) for part, future in zip(slices, futures))
+            self._cond.notify()
+        return [output for future in futures for output in future.result()]
+
+    def _ensure_worker(self):
+        # Threads do not survive fork, so restart the worker in each process.
+        if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        self._worker_pid = os.getpid()
+        if self.concurrency > 1:
+            self._dispatch = ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix=f'{self.name}-dispatch')
+            self._slots = threading.Semaphore(self.concurrency)
+        self._worker = threading.Thread(target=self._run, name=f'{self.name}-worker', daemon=True)
+        self._worker.start()
+
+    def _collect(self):
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            deadline = time.monotonic() + self.window
+            batch = [self._pending.popleft()]
+            size = len(batch[0][0])
+            while size < self.max_batch_size:
+                if not self._pending:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                    continue
+                if size + len(self._pending[0][0]) > self.max_batch_size:
+                    break
+                entry = self._pending.popleft()
+                batch.append(entry)
+                size += len(entry[0])
+            return batch
+
+    def _run(self):
+        while True:
+            if self._slots is None:
+                self._execute(self._collect())
+                continue
+            # Wait for a free slot before collecting, so waiting inputs keep joining the next batch
+            self._slots.acquire()
+            batch = self._collect()
+            self._dispatch.submit(self._execute_in_slot, batch)
+
+    def _execute_in_slot(self, batch):
+        try:
+            self._execute(batch)
+        finally:
+            self._slots.release()
+
+    def _execute(self, batch):
+        now = time.monotonic()
+        live = []
+        for items, future, deadline in batch:
+            if deadline is not None and now >= deadline:
+                LOAD_SHED.labels(reason='expired').inc()
+                future.set_exception(DeadlineExceeded())
+            else:
+                live.append((items, future))
+        if not live:
+            return
+
+        flat = [item for items, _ in live for item in items]
+        try:
+            outputs = self.batch_fn(flat)
+        except Exception as e:
+            logger.error(f"{self.name} batch of {len(flat)} failed: {e}")
+            for _, future in live:
+                future.set_exception(e)
+            return
+
+        offset = 0
+        for items, future in live:
+            future.set_result(outputs[offset:offset + len(items)])
+            offset += len(items)
+
+
+def batcher_from_env(batch_fn: Callable[[List[Any]], Sequence[Any]], name: str, concurrency: int = 1) -> MicroBatcher:
+    """Build a MicroBatcher configured by NLP_BATCH_WINDOW_MS / NLP_BATCH_MAX_SIZE / NLP_BATCH_CONCURRENCY."""
+    return MicroBatcher(
+        batch_fn,
+        max_batch_size=int(os.getenv('NLP_BATCH_MAX_SIZE', 32)),
+        window_ms=float(os.getenv('NLP_BATCH_WINDOW_MS', 5)),
+        name=name,
+        concurrency=int(os.getenv('NLP_BATCH_CONCURRENCY', concurrency)),
+    )
@@ -0,0 +1,58 @@
+"""Benchmark helpers for the NLP service (run the modules from nlp_backend/)."""
+import os
+import json
+import math
+import resource
+from typing import Dict, List
+
+CORPUS_PATH = os.path.join(os.path.dirname(__file__), 'dreams.json')
+
+
+def load_corpus(path: str = CORPUS_PATH) -> List[str]:
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _proc_status(field: str) -> float:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return -1.0
+
+
+def rss_mb() -> float:
+    """Current resident set size in MiB (Linux only; -1 elsewhere)."""
+    return _proc_status('VmRSS')
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process in MiB."""
+    peak = _proc_status('VmHWM')
+    if peak >= 0:
+        return peak
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def latency_summary(samples_ms: List[float]) -> Dict[str, float]:
+    if not samples_ms:
+        return {}
+    ordered = sorted(samples_ms)
+
+    def pct(p):
+        # Nearest-rank percentile
+        index = min(len(ordered) - 1, max(0, math.ceil(p / 100.0 * len(ordered)) - 1))
+        return round(ordered[index], 3)
+
+    return {
+        'count': len(ordered),
+        'mean_ms': round(sum(ordered) / len(ordered), 3),
+        'p50_ms': pct(50),
+        'p95_ms': pct(95),
+        'p99_ms': pct(99),
+        'max_ms': round(ordered[-1], 3),
+    }
@@ -0,0 +1,122 @@
+"""Compare inference backends (fp32 torch, int8 quantized, ONNX) on a fixed dream corpus.
+
+    cd nlp_backend && python -m bench.backends --backends torch quantized onnx --out backends.json
+
+Each backend runs in its own process so load time and memory are measured in
+isolation. A backend that fails to load falls back to fp32, and the "actual"
+column shows what was measured. Label agreement and embedding cosine similarity are reported
+against the first backend listed (normally fp32 torch).
+"""
+import time
+import json
+import argparse
+import multiprocessing
+
+from bench import latency_summary, load_corpus, peak_rss_mb, rss_mb
+
+EMOTION_MODEL = "j-hartmann/emotion-english-distilroberta-base"
+SENTIMENT_MODEL = "cardiffnlp/twitter-roberta-base-sentiment-latest"
+SENTENCE_MODEL = "all-MiniLM-L6-v2"
+
+
+def _time_calls(fn, corpus, repeats):
+    samples = []
+    outputs = None
+    for _ in range(repeats):
+        outputs = []
+        for text in corpus:
+            start = time.perf_counter()
+            outputs.append(fn(text))
+            samples.append((time.perf_counter() - start) * 1000)
+    return samples, outputs
+
+
+def run_backend(backend: str, corpus, repeats: int):
+    from inference_backend import load_sentence_encoder, load_text_classifier
+
+    result = {'backend': backend, 'rss_before_mb': rss_mb()}
+
+    start = time.perf_counter()
+    emotion, emotion_backend = load_text_classifier("text-classification", EMOTION_MODEL, backend)
+    sentiment, sentiment_backend = load_text_classifier("sentiment-analysis", SENTIMENT_MODEL, backend)
+    encoder, encoder_backend = load_sentence_encoder(SENTENCE_MODEL, backend)
+    result['load_seconds'] = round(time.perf_counter() - start, 3)
+    # A backend that failed to load falls back to fp32; report what was measured, not what was asked for
+    result['model_backends'] = {'emotion': emotion_backend, 'sentiment': sentiment_backend,
+                                'sentence': encoder_backend}
+    result['actual'] = '+'.join(sorted(set(result['model_backends'].values())))
+    result['rss_loaded_mb'] = rss_mb()
+
+    # Warm up once so lazy initialisation doesn't land in the measurements
+    emotion(corpus[0]), sentiment(corpus[0]), encoder.encode([corpus[0]])
+
+    samples, outputs = _time_calls(lambda t: emotion(t, truncation=True)[0]['label'], corpus, repeats)
+    result['emotion'] = {'latency': latency_summary(samples), 'labels': outputs}
+    samples, outputs = _time_calls(lambda t: sentiment(t, truncation=True)[0]['label'], corpus, repeats)
+    result['sentiment'] = {'latency': latency_summary(samples), 'labels': outputs}
+    samples, outputs = _time_calls(
+        lambda t: encoder.encode([t], normalize_embeddings=True, show_progress_bar=False)[0].tolist(), corpus, repeats
+    )
+    result['sentence'] = {'latency': latency_summary(samples), 'embeddings': outputs}
+
+    start = time.perf_counter()
+    emotion(corpus, batch_size=len(corpus), truncation=True)
+    result['emotion']['batched_ms'] = round((time.perf_counter() - start) * 1000, 3)
+
+    result['peak_rss_mb'] = peak_rss_mb()
+    return result
+
+
+def compare(reference, candidate):
+    def agreement(stage):
+        pairs = list(zip(reference[stage]['labels'], candidate[stage]['labels']))
+        return round(sum(a == b for a, b in pairs) / len(pairs), 4) if pairs else None
+
+    cosines = [sum(a * b for a, b in zip(u, v))
+               for u, v in zip(reference['sentence']['embeddings'], candidate['sentence']['embeddings'])]
+    return {
+        'emotion_label_agreement': agreement('emotion'),
+        'sentiment_label_agreement': agreement('sentiment'),
+        'embedding_cosine_mean': round(sum(cosines) / len(cosines), 5) if cosines else None,
+        'embedding_cosine_min': round(min(cosines), 5) if cosines else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backends', nargs='+', default=['torch', 'quantized', 'onnx'])
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--out', default=None, help='write the full results as JSON')
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    ctx = multiprocessing.get_context('spawn')
+    results = []
+    for backend in args.backends:
+        with ctx.Pool(1) as pool:
+            results.append(pool.apply(run_backend, (backend, corpus, args.repeats)))
+
+    reference = results[0]
+    for result in results:
+        result['vs_' + reference['backend']] = compare(reference, result)
+
+    print(f"{'backend':<10} {'actual':<16} {'load s':>7} {'rss MB':>8} {'emo p50':>8} {'emo p95':>8} "
+          f"{'sent p50':>9} {'enc p50':>8} {'emo agr':>8} {'sent agr':>9} {'cos':>7}")
+    for r in results:
+        vs = r['vs_' + reference['backend']]
+        print(f"{r['backend']:<10} {r['actual']:<16} {r['load_seconds']:>7} {r['rss_loaded_mb'] - r['rss_before_mb']:>8.0f} "
+              f"{r['emotion']['latency']['p50_ms']:>8} {r['emotion']['latency']['p95_ms']:>8} "
+              f"{r['sentiment']['latency']['p50_ms']:>9} {r['sentence']['latency']['p50_ms']:>8} "
+              f"{vs['emotion_label_agreement']:>8} {vs['sentiment_label_agreement']:>9} {vs['embedding_cosine_mean']:>7}")
+
+    for r in results:
+        if r['actual'] != r['backend']:
+            print(f"warning: {r['backend']} fell back for some models: {r['model_backends']}")
+
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Deterministic stand-ins for the NLP models, so benchmarks run offline without weights.
+
+Outputs depend only on the input text (via CRC32), and each call can sleep to
+emulate model cost: `base_ms` per call plus `per_char_ms` per input character.
+"""
+import re
+import time
+import zlib
+from typing import List
+
+import numpy as np
+
+EMOTION_LABELS = ['anger', 'disgust', 'fear', 'joy', 'neutral', 'sadness', 'surprise']
+SENTIMENT_LABELS = ['negative', 'neutral', 'positive']
+STOP_WORDS = {'the', 'and', 'was', 'were', 'that', 'with', 'this', 'from', 'have', 'had', 'but', 'for',
+              'not', 'you', 'they', 'them', 'then', 'there', 'into', 'when', 'what', 'which', 'would'}
+WORD = re.compile(r"[A-Za-z']+|[^\sA-Za-z']")
+
+
+def _seed(text: str) -> int:
+    return zlib.crc32(text.encode('utf-8'))
+
+
+class _Cost:
+    def __init__(self, base_ms: float = 0.0, per_char_ms: float = 0.0):
+        self.base_ms = base_ms
+        self.per_char_ms = per_char_ms
+
+    def spend(self, texts: List[str]):
+        delay = self.base_ms + self.per_char_ms * sum(len(t) for t in texts)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+
+
+class StubClassifier(_Cost):
+    """Mimics a HF text-classification pipeline (str -> [dict], list -> [dict, ...])."""
+
+    def __init__(self, labels: List[str], **cost):
+        super().__init__(**cost)
+        self.labels = labels
+
+    def _scores(self, text: str):
+        rng = np.random.default_rng(_seed(text))
+        scores = rng.dirichlet(np.ones(len(self.labels)))
+        return sorted(({'label': label, 'score': float(score)} for label, score in zip(self.labels, scores)),
+                      key=lambda x: x['score'], reverse=True)
+
+    def __call__(self, inputs, top_k=1, **kwargs):
+        texts = [inputs] if isinstance(inputs, str) else list(inputs)
+        self.spend(texts)
+        outputs = [self._scores(text) if top_k is None else self._scores(text)[0] for text in texts]
+        if isinstance(inputs, str):
+            return outputs[0] if top_k is None else outputs
+        return outputs
+
+
+class StubTokenizer:
+    """Whitespace tokenizer with the encode/decode surface the summarizer code uses."""
+
+    def encode(self, text: str, add_special_tokens: bool = True) -> List[str]:
+        return text.split()
+
+    def decode(self, ids: List[str]) -> str:
+        return ' '.join(ids)
+
+
+class StubSummarizer(_Cost):
+    def __init__(self, **cost):
+        super().__init__(**cost)
+        self.tokenizer = StubTokenizer()
+
+    def __call__(self, inputs, max_length=150, min_length=0, **kwargs):
+        texts = [inputs] if isinstance(inputs, str) else list(inputs)
+        self.spend(texts)
+        return [{'summary_text': ' '.join(text.split()[:max_length])} for text in texts]
+
+
+class StubEncoder(_Cost):
+    """Hashing-trick bag-of-words embeddings shaped like MiniLM's (384 dims)."""
+
+    def __init__(self, dim: int = 384, **cost):
+        super().__init__(**cost)
+        self.dim = dim
+
+    def encode(self, sentences, normalize_embeddings=False, **kwargs):
+        texts = [sentences] if isinstance(sentences, str) else list(sentences)
+        self.spend(texts)
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                matrix[row, _seed(word) % self.dim] += 1.0
+        if normalize_embeddings:
+            norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+            matrix /= np.where(norms == 0, 1.0, norms)
+        return matrix[0] if isinstance(sentences, str) else matrix
+
+
+class _Token:
+    def __init__(self, text: str):
+        self.text = text
+        self.lemma_ = text.lower()
+        self.is_punct = not text[0].isalpha()
+        self.is_stop = self.lemma_ in STOP_WORDS
+        self.is_alpha = text.isalpha()
+        self.pos_ = 'PUNCT' if self.is_punct else ('NOUN' if len(text) > 3 else 'ADJ')
+
+
+class _Doc(list):
+    ents = ()
+
+
+class StubSpacy(_Cost):
+    """Regex tokenizer with a spaCy-like Doc/Token surface."""
+
+    pipe_names = ['tok2vec', 'tagger', 'attribute_ruler', 'lemmatizer', 'ner']
+
+    def __call__(self, text: str):
+        self.spend([text])
+        return _Doc(_Token(t) for t in WORD.findall(text))
+
+    def pipe(self, texts, **kwargs):
+        for text in texts:
+            yield self(text)
+
+
+def split_sentences(text: str) -> List[str]:
+    """Offline replacement for nltk.sent_tokenize (no punkt download needed)."""
+    return [s for s in re.split(r'(?<=[.!?])\s+', text.strip()) if s]
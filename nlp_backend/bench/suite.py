@@ -0,0 +1,246 @@
+"""Latency/throughput benchmark for DreamAnalyzer stages and the HTTP endpoints.
+
+    cd nlp_backend
+    python -m bench.suite --stub --out bench-results.json          # offline, fake models
+    python -m bench.suite --out after.json --compare before.json   # real models
+    python -m bench.suite --url http://localhost:5000 --skip-stages  # a running server
+
+Results (p50/p95/p99 latency, throughput, peak RSS) are written as JSON so runs
+can be diffed with --compare. The result cache is disabled unless --cache is
+given, so repeated inputs measure real work.
+"""
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import platform
+import tempfile
+import importlib
+import threading
+import urllib.request
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from bench import latency_summary, load_corpus, peak_rss_mb
+
+STAGES = [
+    'extract_keywords',
+    'analyze_emotions',
+    'analyze_sentiment',
+    'analyze_themes_and_symbols_semantic',
+    'generate_summary',
+    'analyze_lite',
+]
+ENDPOINTS = ['/analyze', '/extract-keywords', '/analyze-emotions']
+# Dream length -> how many corpus dreams are concatenated
+LENGTHS = {'short': 1, 'medium': 4, 'long': 16}
+
+
+def make_texts(corpus, dreams_per_text: int, count: int):
+    """Distinct texts of roughly the requested size, so no two iterations share input."""
+    texts = []
+    for i in range(count):
+        parts = [corpus[(i + j) % len(corpus)] for j in range(dreams_per_text)]
+        texts.append(f"Night {i}. " + ' '.join(parts))
+    return texts
+
+
+def load_app(stub: bool, cache: bool, stub_cost: dict, inference_workers: int = 0):
+    if not cache:
+        os.environ['NLP_CACHE_MAX_ENTRIES'] = '0'
+        os.environ['NLP_SENTENCE_CACHE_MAX_ENTRIES'] = '0'
+        os.environ.pop('NLP_CACHE_DB', None)
+    os.environ.pop('NLP_PRELOAD_MODELS', None)
+    if inference_workers:
+        os.environ['NLP_INFERENCE_WORKERS'] = str(inference_workers)
+    if stub:
+        scratch = tempfile.mkdtemp(prefix='nlp-bench-')
+        os.environ['NLP_LEXICON_INDEX_DIR'] = os.path.join(scratch, 'lexicon_index')
+        os.environ['NLP_VECTOR_STORE_DIR'] = os.path.join(scratch, 'vector_store')
+        os.environ['NLP_KEYWORD_STATS_PATH'] = os.path.join(scratch, 'keyword_stats.json')
+
+    app_module = importlib.import_module('app')
+    # Per-request INFO lines would drown out the results
+    logging.getLogger('app').setLevel(logging.WARNING)
+    if stub:
+        install_stubs(app_module, stub_cost)
+    if inference_workers:
+        app_module.start_inference_workers()
+    return app_module
+
+
+def install_stubs(app_module, cost: dict):
+    from bench import stubs
+
+    models = app_module.models
+    models.register('spacy', lambda: stubs.StubSpacy(**cost))
+    models.register('emotion_classifier', lambda: stubs.StubClassifier(stubs.EMOTION_LABELS, **cost))
+    models.register('sentiment_analyzer', lambda: stubs.StubClassifier(stubs.SENTIMENT_LABELS, **cost))
+    models.register('summarizer', lambda: stubs.StubSummarizer(**cost))
+    models.register('sentence_transformer', lambda: stubs.StubEncoder(**cost))
+    app_module.nltk.sent_tokenize = stubs.split_sentences
+
+
+def bench_stages(analyzer, corpus, iterations: int):
+    results = []
+    for stage in STAGES:
+        method = getattr(analyzer, stage)
+        for length, size in LENGTHS.items():
+            texts = make_texts(corpus, size, iterations + 1)
+            method(texts[0])  # warm-up: loads the model
+            samples = []
+            for text in texts[1:]:
+                start = time.perf_counter()
+                method(text)
+                samples.append((time.perf_counter() - start) * 1000)
+            results.append({
+                'kind': 'stage', 'name': stage, 'length': length, 'concurrency': 1,
+                'input_chars': sum(len(t) for t in texts[1:]) // max(1, len(texts) - 1),
+                **latency_summary(samples),
+                'throughput_rps': round(len(samples) / (sum(samples) / 1000), 3) if samples else 0,
+                'peak_rss_mb': peak_rss_mb(),
+            })
+            print(_row(results[-1]), flush=True)
+    return results
+
+
+def _client(flask_app, url):
+    """Return a post(path, payload) -> status callable, one per thread."""
+    if url:
+        def post(path, payload):
+            request = urllib.request.Request(url.rstrip('/') + path, data=json.dumps(payload).encode(),
+                                             headers={'Content-Type': 'application/json'})
+            try:
+                with urllib.request.urlopen(request, timeout=120) as response:
+                    response.read()
+                    return response.status
+            except urllib.error.HTTPError as e:
+                return e.code
+        return post
+
+    local = threading.local()
+
+    def post(path, payload):
+        if not hasattr(local, 'client'):
+            local.client = flask_app.test_client()
+        return local.client.post(path, json=payload).status_code
+    return post
+
+
+def bench_endpoints(flask_app, url, corpus, concurrency_levels, requests_per_level: int):
+    post = _client(flask_app, url)
+    results = []
+    for endpoint in ENDPOINTS:
+        for length, size in LENGTHS.items():
+            post(endpoint, {'content': make_texts(corpus, size, 1)[0]})  # warm-up
+            for concurrency in concurrency_levels:
+                total = max(requests_per_level, concurrency * 4)
+                texts = make_texts(corpus, size, total)
+                samples = []
+                errors = 0
+                lock = threading.Lock()
+
+                def call(text):
+                    nonlocal errors
+                    start = time.perf_counter()
+                    status = post(endpoint, {'content': text})
+                    elapsed = (time.perf_counter() - start) * 1000
+                    with lock:
+                        samples.append(elapsed)
+                        if status != 200:
+                            errors += 1
+
+                wall_start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                    list(pool.map(call, texts))
+                wall = time.perf_counter() - wall_start
+
+                results.append({
+                    'kind': 'endpoint', 'name': endpoint, 'length': length, 'concurrency': concurrency,
+                    'input_chars': sum(len(t) for t in texts) // len(texts),
+                    **latency_summary(samples),
+                    'throughput_rps': round(total / wall, 3),
+                    'errors': errors,
+                    'peak_rss_mb': peak_rss_mb(),
+                })
+                print(_row(results[-1]), flush=True)
+    return results
+
+
+def _row(r):
+    return (f"{r['kind']:<8} {r['name']:<38} {r['length']:<7} c={r['concurrency']:<3} "
+            f"p50={r['p50_ms']:>9.2f}ms p95={r['p95_ms']:>9.2f}ms p99={r['p99_ms']:>9.2f}ms "
+            f"{r['throughput_rps']:>8.2f} rps  rss={r['peak_rss_mb']:.0f}MB")
+
+
+def compare(current, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    key = lambda r: (r['kind'], r['name'], r['length'], r['concurrency'])
+    previous = {key(r): r for r in baseline['results']}
+    print(f"\nCompared with {baseline_path} (ratio current/baseline; <1 is faster):")
+    for r in current['results']:
+        old = previous.get(key(r))
+        if not old:
+            continue
+        ratio = lambda field: r[field] / old[field] if old.get(field) else float('nan')
+        print(f"{r['kind']:<8} {r['name']:<38} {r['length']:<7} c={r['concurrency']:<3} "
+              f"p50 x{ratio('p50_ms'):.2f}  p95 x{ratio('p95_ms'):.2f}  p99 x{ratio('p99_ms'):.2f}  "
+              f"throughput x{ratio('throughput_rps'):.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stub', action='store_true', help='use deterministic fake models (no downloads)')
+    parser.add_argument('--stub-base-ms', type=float, default=0.0, help='emulated cost per stub model call')
+    parser.add_argument('--stub-per-char-ms', type=float, default=0.0, help='emulated cost per input character')
+    parser.add_argument('--cache', action='store_true', help='leave the result cache enabled')
+    parser.add_argument('--inference-workers', type=int, default=0,
+                        help='fork this many inference worker processes (NLP_INFERENCE_WORKERS)')
+    parser.add_argument('--url', help='benchmark a running server instead of the in-process app')
+    parser.add_argument('--iterations', type=int, default=20, help='calls per stage and length')
+    parser.add_argument('--requests', type=int, default=40, help='minimum requests per endpoint/length/concurrency')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--skip-stages', action='store_true')
+    parser.add_argument('--skip-endpoints', action='store_true')
+    parser.add_argument('--out', help='write results as JSON')
+    parser.add_argument('--compare', help='baseline JSON from a previous run')
+    args = parser.parse_args()
+
+    corpus = load_corpus()
+    stub_cost = {'base_ms': args.stub_base_ms, 'per_char_ms': args.stub_per_char_ms}
+    app_module = None if (args.url and args.skip_stages) else load_app(args.stub, args.cache, stub_cost,
+                                                                         args.inference_workers)
+
+    results = []
+    if not args.skip_stages:
+        results += bench_stages(app_module.dream_analyzer, corpus, args.iterations)
+    if not args.skip_endpoints:
+        results += bench_endpoints(app_module.app if app_module else None, args.url, corpus,
+                                   args.concurrency, args.requests)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(),
+            'stub': args.stub,
+            'cache': args.cache,
+            'url': args.url,
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'peak_rss_mb': peak_rss_mb(),
+            'env': {k: v for k, v in os.environ.items() if k.startswith('NLP_')},
+        },
+        'results': results,
+    }
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == '__main__':
+    main()
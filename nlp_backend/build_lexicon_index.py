@@ -0,0 +1,31 @@
+"""Build the memory-mapped embedding index for the dream theme/symbol lexicon.
+
+    python build_lexicon_index.py [--lexicon data/dream_lexicon.json] [--out data/lexicon_index]
+
+Run it whenever the lexicon file or the sentence model changes; the service
+refuses a stale index and would otherwise encode the lexicon at startup.
+"""
+import argparse
+import logging
+
+from lexicon import DreamLexicon, lexicon_index_dir, lexicon_path
+
+SENTENCE_MODEL = "all-MiniLM-L6-v2"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--lexicon', default=lexicon_path())
+    parser.add_argument('--out', default=lexicon_index_dir())
+    parser.add_argument('--model', default=SENTENCE_MODEL)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from sentence_transformers import SentenceTransformer
+
+    lexicon = DreamLexicon(args.lexicon)
+    lexicon.build_index(SentenceTransformer(args.model), args.out, args.model)
+
+
+if __name__ == '__main__':
+    main()
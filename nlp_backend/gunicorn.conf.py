@@ -0,0 +1,59 @@
+"""Gunicorn settings for the NLP service.
+
+    NLP_PRELOAD_MODELS=all gunicorn -c gunicorn.conf.py app:app
+
+With NLP_PRELOAD_MODELS set, the app (and the requested models) is imported
+once in the master before workers are forked, so the workers share the model
+weights copy-on-write instead of each loading its own copy.
+
+On a many-core box, serve with one HTTP worker and several inference worker
+processes instead, each with its own torch thread budget (and optionally its
+own CPU slice); requests go to the least-loaded inference worker:
+
+    NLP_INFERENCE_WORKERS=4 NLP_PIN_CPUS=1 WEB_CONCURRENCY=1 GUNICORN_THREADS=16 \
+        gunicorn -c gunicorn.conf.py app:app
+
+Metrics are kept per process, so with several HTTP workers /metrics
+aggregates them through snapshot files in NLP_METRICS_DIR (a directory under
+the system temp dir unless set), cleared when the server starts.
+"""
+import gc
+import os
+import glob
+import tempfile
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+workers = int(os.getenv('WEB_CONCURRENCY', 2))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+preload_app = bool(os.getenv('NLP_PRELOAD_MODELS', '').strip())
+
+if workers > 1:
+    os.environ.setdefault('NLP_METRICS_DIR', os.path.join(tempfile.gettempdir(), f"nlp-metrics-{os.getenv('PORT', 5000)}"))
+
+
+def on_starting(server):
+    # Snapshots left by a previous run would be added to this one's counters
+    if os.getenv('NLP_METRICS_DIR'):
+        for path in glob.glob(os.path.join(os.getenv('NLP_METRICS_DIR'), 'metrics.*.json*')):
+            os.remove(path)
+
+
+def when_ready(server):
+    # Move everything loaded so far out of the GC's tracked generations so
+    # collections in the workers don't touch (and copy) the shared pages.
+    if preload_app:
+        gc.freeze()
+
+
+def post_fork(server, worker):
+    # The HTTP worker is still single-threaded here, so it is safe to fork the
+    # inference workers from it (after loading their models, to share the weights)
+    if int(os.getenv('NLP_INFERENCE_WORKERS', 0)) > 0:
+        import app
+        app.start_inference_workers()
+
+    # Every worker writes its metrics snapshot, whether or not it is the one scraped
+    if os.getenv('NLP_METRICS_DIR'):
+        from metrics import REGISTRY
+        REGISTRY.start_writer()
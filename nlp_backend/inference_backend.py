@@ -0,0 +1,71 @@
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('torch', 'quantized', 'onnx')
+# The onnx backend needs the optional packages listed here
+ONNX_REQUIREMENTS = 'requirements-onnx.txt'
+
+
+def configured_backend() -> str:
+    backend = os.getenv('NLP_INFERENCE_BACKEND', 'torch').strip().lower()
+    if backend not in BACKENDS:
+        logger.warning(f"Unknown NLP_INFERENCE_BACKEND {backend!r}; using torch")
+        return 'torch'
+    return backend
+
+
+def load_text_classifier(task: str, model_name: str, backend: str) -> tuple:
+    """(pipeline, backend actually used): the requested backend, or fp32 PyTorch if it cannot be loaded."""
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer, pipeline
+
+    if backend == 'onnx':
+        try:
+            from optimum.onnxruntime import ORTModelForSequenceClassification
+            tokenizer = AutoTokenizer.from_pretrained(model_name)
+            model = ORTModelForSequenceClassification.from_pretrained(model_name, export=True)
+            return pipeline(task, model=model, tokenizer=tokenizer), 'onnx'
+        except ImportError:
+            logger.warning(f"NLP_INFERENCE_BACKEND=onnx but optimum[onnxruntime] is not installed "
+                           f"(see {ONNX_REQUIREMENTS}); falling back to fp32 PyTorch for {model_name}")
+        except Exception as e:
+            logger.warning(f"ONNX export of {model_name} failed; falling back to fp32 PyTorch: {e}")
+
+    if backend == 'quantized':
+        try:
+            tokenizer = AutoTokenizer.from_pretrained(model_name)
+            model = AutoModelForSequenceClassification.from_pretrained(model_name)
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            return pipeline(task, model=model, tokenizer=tokenizer, device=-1), 'quantized'
+        except Exception as e:
+            logger.warning(f"int8 quantization of {model_name} failed; falling back to fp32 PyTorch: {e}")
+
+    return pipeline(task, model=model_name, device=0 if torch.cuda.is_available() else -1), 'torch'
+
+
+def load_sentence_encoder(model_name: str, backend: str) -> tuple:
+    """(SentenceTransformer, backend actually used): the requested backend, or fp32 PyTorch if it cannot be loaded."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    if backend == 'onnx':
+        try:
+            # The ONNX backend needs sentence-transformers >= 3.2
+            return SentenceTransformer(model_name, backend='onnx'), 'onnx'
+        except TypeError:
+            import sentence_transformers
+            logger.warning(f"NLP_INFERENCE_BACKEND=onnx but sentence-transformers {sentence_transformers.__version__} "
+                           f"has no ONNX backend (needs >= 3.2, see {ONNX_REQUIREMENTS}); "
+                           f"falling back to fp32 PyTorch for {model_name}")
+        except Exception as e:
+            logger.warning(f"ONNX load of {model_name} failed; falling back to fp32 PyTorch: {e}")
+
+    model = SentenceTransformer(model_name)
+    if backend == 'quantized':
+        try:
+            return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8), 'quantized'
+        except Exception as e:
+            logger.warning(f"int8 quantization of {model_name} failed; falling back to fp32 PyTorch: {e}")
+    return model, 'torch'
@@ -0,0 +1,154 @@
+import os
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Mapping, Optional
+
+from metrics import REGISTRY
+
+LOAD_SHED = REGISTRY.counter('nlp_load_shed_total', 'Inference work rejected or dropped before reaching a model.',
+                             ['reason'])
+
+# Monotonic deadline of the request whose inference is running in this context
+_deadline: contextvars.ContextVar = contextvars.ContextVar('inference_deadline', default=None)
+
+
+class Overloaded(Exception):
+    """Every inference slot is busy and the wait queue is full."""
+
+    def __init__(self, retry_after: int):
+        super().__init__('inference queue is full')
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """The caller's deadline passed before the work could run."""
+
+    def __init__(self, message: str = 'request deadline exceeded'):
+        super().__init__(message)
+
+
+def deadline_from_headers(headers: Mapping[str, str], default_timeout: float) -> float:
+    """Monotonic deadline for a request.
+
+    X-Request-Deadline is an absolute Unix time (seconds, or milliseconds as sent
+    by Date.now()), so time spent queued before we saw the request counts against
+    it. X-Request-Timeout-Ms is a budget relative to now. Without either header
+    the budget is `default_timeout` seconds.
+    """
+    now = time.monotonic()
+    absolute = headers.get('X-Request-Deadline')
+    if absolute:
+        try:
+            value = float(absolute)
+            if value > 1e11:
+                value /= 1000.0
+            return now + (value - time.time())
+        except ValueError:
+            pass
+    relative = headers.get('X-Request-Timeout-Ms')
+    if relative:
+        try:
+            return now + max(0.0, float(relative)) / 1000.0
+        except ValueError:
+            pass
+    return now + default_timeout
+
+
+def current_deadline() -> Optional[float]:
+    return _deadline.get()
+
+
+def deadline_expired(deadline: Optional[float] = None) -> bool:
+    deadline = deadline if deadline is not None else _deadline.get()
+    return deadline is not None and time.monotonic() >= deadline
+
+
+@contextmanager
+def deadline_scope(deadline: float):
+    """Make `deadline` the current deadline for the block (and contexts copied from it)."""
+    token = _deadline.set(deadline)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def check_deadline():
+    """Raise DeadlineExceeded if the current request's deadline has passed."""
+    if deadline_expired():
+        LOAD_SHED.labels(reason='expired').inc()
+        raise DeadlineExceeded()
+
+
+class InferenceGate:
+    """Bounds how many requests run inference at once and how many may wait.
+
+    Up to `max_concurrency` requests hold a slot; up to `max_queue` more wait
+    for one until their deadline. Anything beyond that is rejected immediately
+    with Overloaded so callers can back off instead of piling onto the CPU.
+    """
+
+    def __init__(self, max_concurrency: int = 4, max_queue: int = 16, retry_after: int = 1):
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_queue = max(0, int(max_queue))
+        self.retry_after = max(1, int(retry_after))
+        self._active = 0
+        self._waiting = 0
+        self._cond = threading.Condition()
+
+    @contextmanager
+    def slot(self, deadline: float):
+        """Hold an inference slot for the duration of the block, with `deadline` as the current deadline."""
+        self.acquire(deadline)
+        try:
+            with deadline_scope(deadline):
+                yield
+        finally:
+            self.release()
+
+    def acquire(self, deadline: float):
+        """Take a slot, waiting for one until `deadline`; pair with release() (or use slot())."""
+        with self._cond:
+            if time.monotonic() >= deadline:
+                LOAD_SHED.labels(reason='expired').inc()
+                raise DeadlineExceeded()
+            if self._active >= self.max_concurrency:
+                if self._waiting >= self.max_queue:
+                    LOAD_SHED.labels(reason='queue_full').inc()
+                    raise Overloaded(self.retry_after)
+                self._waiting += 1
+                try:
+                    while self._active >= self.max_concurrency:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            LOAD_SHED.labels(reason='expired').inc()
+                            raise DeadlineExceeded()
+                        self._cond.wait(remaining)
+                finally:
+                    self._waiting -= 1
+            self._active += 1
+
+    def release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify()
+
+    def stats(self):
+        with self._cond:
+            return {
+                'active': self._active,
+                'waiting': self._waiting,
+                'max_concurrency': self.max_concurrency,
+                'max_queue': self.max_queue,
+            }
+
+
+def gate_from_env() -> InferenceGate:
+    """Build an InferenceGate configured by NLP_INFERENCE_CONCURRENCY / NLP_INFERENCE_QUEUE_DEPTH / NLP_RETRY_AFTER_SECONDS."""
+    return InferenceGate(
+        max_concurrency=int(os.getenv('NLP_INFERENCE_CONCURRENCY', 4)),
+        max_queue=int(os.getenv('NLP_INFERENCE_QUEUE_DEPTH', 16)),
+        retry_after=int(os.getenv('NLP_RETRY_AFTER_SECONDS', 1)),
+    )
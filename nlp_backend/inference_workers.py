@@ -0,0 +1,214 @@
+import os
+import atexit
+import logging
+import threading
+import itertools
+import multiprocessing
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _cpu_slices(processes: int) -> List[List[int]]:
+    """Split the CPUs this process may use into one contiguous slice per worker."""
+    if hasattr(os, 'sched_getaffinity'):
+        cpus = sorted(os.sched_getaffinity(0))
+    else:
+        cpus = list(range(os.cpu_count() or 1))
+    size = max(1, len(cpus) // processes)
+    return [cpus[(i * size) % len(cpus):(i * size) % len(cpus) + size] for i in range(processes)]
+
+
+def _configure_threads(threads: int, cpus: Optional[List[int]]):
+    if cpus and hasattr(os, 'sched_setaffinity'):
+        try:
+            os.sched_setaffinity(0, cpus)
+        except OSError as e:
+            logger.warning(f"Could not pin inference worker to CPUs {cpus}: {e}")
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Only settable before the first parallel op, which the parent may already have run
+        pass
+
+
+class _Worker:
+    def __init__(self, index: int, process, conn):
+        self.index = index
+        self.process = process
+        self.conn = conn
+        self.load = 0
+        self.alive = True
+        self.pending: Dict[int, tuple] = {}
+        self.send_lock = threading.Lock()
+
+
+class InferenceWorkers:
+    """Runs registered model functions in forked worker processes.
+
+    Workers are forked after the models are loaded, so they share the weights
+    copy-on-write, and each gets its own torch thread count (and optionally its
+    own CPU slice) so N workers do not oversubscribe the cores. Calls go to the
+    worker with the fewest outstanding inputs. With no workers started (or
+    inside a worker) `call` runs the function in-process.
+    """
+
+    def __init__(self, processes: int = 0, threads_per_worker: Optional[int] = None, pin_cpus: bool = False):
+        self.processes = max(0, int(processes))
+        self.pin_cpus = pin_cpus
+        cpu_count = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+        self.threads_per_worker = threads_per_worker or max(1, cpu_count // max(1, self.processes))
+        self._functions: Dict[str, Callable] = {}
+        self._workers: List[_Worker] = []
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._owner_pid = None
+        self._in_worker = False
+        self._stopping = False
+
+    def register(self, fn: Callable) -> Callable:
+        """Make `fn` callable in the workers; use as a decorator on module-level functions."""
+        self._functions[fn.__name__] = fn
+        return fn
+
+    @property
+    def running(self) -> bool:
+        return self._owner_pid == os.getpid() and any(worker.alive for worker in self._workers)
+
+    def start(self, before_fork: Optional[Callable[[], Any]] = None):
+        """Fork the workers. Call while the process is still single-threaded (e.g. gunicorn post_fork)."""
+        if self.processes == 0 or self.running or self._in_worker:
+            return
+        if before_fork:
+            before_fork()
+
+        context = multiprocessing.get_context('fork')
+        slices = _cpu_slices(self.processes) if self.pin_cpus else [None] * self.processes
+        self._workers = []
+        for index in range(self.processes):
+            parent_conn, child_conn = context.Pipe()
+            process = context.Process(target=self._serve, args=(index, child_conn, slices[index]),
+                                      name=f'inference-worker-{index}', daemon=True)
+            process.start()
+            child_conn.close()
+            worker = _Worker(index, process, parent_conn)
+            self._workers.append(worker)
+            threading.Thread(target=self._receive, args=(worker,), name=f'inference-worker-{index}-results',
+                             daemon=True).start()
+        self._owner_pid = os.getpid()
+        atexit.register(self.stop)
+        logger.info(f"Started {self.processes} inference workers with {self.threads_per_worker} threads each"
+                    + (f", pinned to {slices}" if self.pin_cpus else ''))
+
+    def call(self, fn: Callable, *args, weight: int = 1, **kwargs):
+        """Run a registered function on the least-loaded worker and wait for its result."""
+        if not self.running:
+            return fn(*args, **kwargs)
+
+        future = Future()
+        with self._lock:
+            alive = [worker for worker in self._workers if worker.alive]
+            worker = min(alive, key=lambda w: w.load) if alive else None
+            if worker:
+                call_id = next(self._ids)
+                worker.pending[call_id] = (future, weight)
+                worker.load += weight
+        if worker is None:
+            return fn(*args, **kwargs)
+        try:
+            with worker.send_lock:
+                worker.conn.send((call_id, fn.__name__, args, kwargs))
+        except (OSError, ValueError) as e:
+            self._fail(worker, e)
+        return future.result()
+
+    def stop(self):
+        """Ask the workers to exit; they also exit on their own when this process dies."""
+        if not self.running:
+            return
+        self._stopping = True
+        for worker in self._workers:
+            try:
+                with worker.send_lock:
+                    worker.conn.send(None)
+            except (OSError, ValueError):
+                pass
+        for worker in self._workers:
+            worker.process.join(timeout=5)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [{
+                'index': worker.index,
+                'pid': worker.process.pid,
+                'alive': worker.alive,
+                'load': worker.load,
+            } for worker in self._workers] if self.running else []
+
+    def _serve(self, index: int, conn, cpus: Optional[List[int]]):
+        self._in_worker = True
+        self._workers = []
+        _configure_threads(self.threads_per_worker, cpus)
+        while True:
+            try:
+                message = conn.recv()
+            except EOFError:
+                return
+            if message is None:
+                return
+            call_id, name, args, kwargs = message
+            try:
+                reply = (call_id, True, self._functions[name](*args, **kwargs))
+            except Exception as e:
+                reply = (call_id, False, e)
+            try:
+                conn.send(reply)
+            except Exception as e:
+                # Unpicklable result or exception
+                conn.send((call_id, False, RuntimeError(f"{name} failed in inference worker {index}: {e!r}")))
+
+    def _receive(self, worker: _Worker):
+        while True:
+            try:
+                call_id, ok, value = worker.conn.recv()
+            except (EOFError, OSError) as e:
+                self._fail(worker, e)
+                return
+            with self._lock:
+                future, weight = worker.pending.pop(call_id)
+                worker.load -= weight
+            if ok:
+                future.set_result(value)
+            else:
+                future.set_exception(value)
+
+    def _fail(self, worker: _Worker, error: Exception):
+        with self._lock:
+            if not worker.alive:
+                return
+            worker.alive = False
+            pending = list(worker.pending.values())
+            worker.pending.clear()
+            worker.load = 0
+        if self._stopping:
+            return
+        logger.error(f"Inference worker {worker.index} (pid {worker.process.pid}) died: {error!r}")
+        for future, _ in pending:
+            if not future.done():
+                future.set_exception(RuntimeError(f'inference worker {worker.index} died'))
+
+
+def workers_from_env() -> InferenceWorkers:
+    """Build InferenceWorkers configured by NLP_INFERENCE_WORKERS / NLP_TORCH_THREADS / NLP_PIN_CPUS."""
+    threads = os.getenv('NLP_TORCH_THREADS')
+    return InferenceWorkers(
+        processes=int(os.getenv('NLP_INFERENCE_WORKERS', 0)),
+        threads_per_worker=int(threads) if threads else None,
+        pin_cpus=os.getenv('NLP_PIN_CPUS', '').strip().lower() in ('1', 'true', 'yes'),
+    )
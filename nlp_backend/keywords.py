@@ -0,0 +1,174 @@
+import os
+import re
+import json
+import math
+import atexit
+import hashlib
+import logging
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: saves from concurrent processes are not serialized
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# Components keyword extraction does not use; skipping them roughly halves en_core_web_sm's cost
+SPACY_EXCLUDE = ['parser', 'senter']
+ENTITY_LABELS = ('PERSON', 'GPE', 'LOC', 'FAC', 'EVENT', 'WORK_OF_ART')
+KEYWORD_POS = ('NOUN', 'ADJ')
+
+WORD = re.compile(r'\b[a-zA-Z]{3,}\b')
+STOP_WORDS = frozenset("""
+about above after again against all also and any are aren because been before being below between both
+but can cannot could did didn does doesn doing don down during each even ever every few for from further
+get got had hadn has hasn have haven having her here hers herself him himself his how into its itself
+just like many more most much must myself nor not now off once one only other our ours ourselves out over
+own really same she should shouldn some still such than that the their theirs them themselves then there
+these they this those through too under until very was wasn were weren what when where which while who
+whom why will with won would wouldn you your yours yourself yourselves
+""".split())
+
+
+class CorpusStats:
+    """Document frequencies over the analyzed dreams, kept incrementally and saved to `path`.
+
+    Ranking reads a snapshot of the counts that only advances when they are
+    saved (every `save_every` new documents), so the same text ranks the same
+    way between saves. Saves merge this process's new counts into the file
+    under a lock, so several workers can share one file. A document is
+    counted once, by content hash, however often it is analyzed again (cache
+    evictions, other workers); the last `max_seen` hashes are remembered. At
+    most `max_terms` terms are kept; the rarest are dropped first.
+    """
+
+    def __init__(self, path: Optional[str] = None, save_every: int = 50, max_terms: int = 200000,
+                 max_seen: int = 100000):
+        self.path = path
+        self.save_every = max(1, int(save_every))
+        self.max_terms = max(1, int(max_terms))
+        self.max_seen = max(1, int(max_seen))
+        self._lock = threading.Lock()
+        self._documents = 0
+        self._frequencies: Dict[str, int] = {}
+        # Content hashes already counted (insertion ordered, oldest first) and the terms of new documents
+        self._seen: Dict[str, None] = {}
+        self._new: Dict[str, Set[str]] = {}
+        if path and os.path.exists(path):
+            self._documents, self._frequencies, self._seen = self._read()
+        if path:
+            atexit.register(self.save)
+
+    def _read(self) -> tuple:
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+            return (int(data.get('documents', 0)), dict(data.get('frequencies') or {}),
+                    dict.fromkeys(data.get('seen') or []))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable keyword stats {self.path}: {e}")
+            return 0, {}, {}
+
+    @staticmethod
+    def document_key(text: str) -> str:
+        return hashlib.sha256(' '.join(text.split()).encode('utf-8')).hexdigest()[:16]
+
+    def idf(self, term: str) -> float:
+        # Smoothed, so unseen terms and an empty corpus still rank by frequency
+        return math.log((1 + self._documents) / (1 + self._frequencies.get(term, 0))) + 1.0
+
+    def observe(self, terms: Iterable[str], document: str):
+        """Count `document` (its text) as containing `terms`, unless it was counted before."""
+        key = self.document_key(document)
+        with self._lock:
+            if key in self._seen or key in self._new:
+                return
+            self._new[key] = set(terms)
+            due = len(self._new) >= self.save_every
+        if due:
+            self.save()
+
+    def save(self):
+        """Merge the new counts into the file (or just the snapshot, without a path)."""
+        with self._lock:
+            new, self._new = self._new, {}
+        if not new:
+            return
+
+        lock_file = None
+        try:
+            if self.path and fcntl:
+                lock_file = open(f'{self.path}.lock', 'w')
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if self.path and os.path.exists(self.path):
+                total_documents, merged, seen = self._read()
+            else:
+                total_documents, merged, seen = self._documents, dict(self._frequencies), dict(self._seen)
+            # Another process may have counted the same document since our last save
+            for key, terms in new.items():
+                if key in seen:
+                    continue
+                seen[key] = None
+                total_documents += 1
+                for term in terms:
+                    merged[term] = merged.get(term, 0) + 1
+            if len(merged) > self.max_terms:
+                merged = dict(sorted(merged.items(), key=lambda item: (-item[1], item[0]))[:self.max_terms])
+            if len(seen) > self.max_seen:
+                seen = dict.fromkeys(list(seen)[-self.max_seen:])
+
+            if self.path:
+                tmp = f'{self.path}.tmp.{os.getpid()}'
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump({'documents': total_documents, 'frequencies': merged, 'seen': list(seen)}, f)
+                os.replace(tmp, self.path)
+        except OSError as e:
+            logger.error(f"Saving keyword stats to {self.path} failed: {e}")
+            with self._lock:
+                self._new.update(new)
+            return
+        finally:
+            if lock_file:
+                lock_file.close()
+
+        with self._lock:
+            self._documents, self._frequencies, self._seen = total_documents, merged, seen
+
+    def stats(self) -> Dict[str, int]:
+        return {'documents': self._documents, 'terms': len(self._frequencies),
+                'unsaved_documents': len(self._new)}
+
+
+def candidates_from_doc(doc) -> List[str]:
+    """Entities and content-word lemmas, in document order."""
+    candidates = [ent.text.lower() for ent in doc.ents if ent.label_ in ENTITY_LABELS]
+    candidates.extend(
+        token.lemma_.lower() for token in doc
+        if token.pos_ in KEYWORD_POS and not token.is_stop and not token.is_punct and len(token.text) > 2
+    )
+    return candidates
+
+
+def candidates_from_text(text: str) -> List[str]:
+    """Regex fallback when spaCy is unavailable: non-stop words of three or more letters."""
+    return [word for word in WORD.findall(text.lower()) if word not in STOP_WORDS]
+
+
+def rank_keywords(candidates: List[str], stats: Optional[CorpusStats] = None, top_k: int = 10) -> List[str]:
+    """Top terms by frequency x IDF; ties go to the term that appears first."""
+    counts = Counter(candidates)
+    first_seen = {}
+    for position, term in enumerate(candidates):
+        first_seen.setdefault(term, position)
+    idf = stats.idf if stats else (lambda term: 1.0)
+    return sorted(counts, key=lambda term: (-counts[term] * idf(term), first_seen[term]))[:top_k]
+
+
+def keyword_stats_from_env() -> CorpusStats:
+    """CorpusStats configured by NLP_KEYWORD_STATS_PATH ('' keeps them in memory) / NLP_KEYWORD_STATS_SAVE_EVERY."""
+    path = os.getenv('NLP_KEYWORD_STATS_PATH',
+                     os.path.join(os.path.dirname(__file__), 'data', 'keyword_stats.json'))
+    return CorpusStats(path or None, save_every=int(os.getenv('NLP_KEYWORD_STATS_SAVE_EVERY', 50)))
@@ -0,0 +1,178 @@
+import os
+import json
+import hashlib
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: concurrent builds are not serialized, but each file is still replaced atomically
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+KINDS = ('themes', 'symbols')
+
+
+class DreamLexicon:
+    """Dream theme/symbol dictionary with a precomputed, memory-mapped embedding index.
+
+    Entries of both kinds share one float32 matrix (themes first, then
+    symbols) of L2-normalized meaning embeddings, so a dream's sentences are
+    matched against the whole lexicon with a single matrix product.
+    """
+
+    def __init__(self, path: str):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+
+        self.names: List[str] = []
+        self.meanings: List[str] = []
+        self.ranges: Dict[str, tuple] = {}
+        for kind in KINDS:
+            entries = data.get(kind) or {}
+            if isinstance(entries, list):
+                entries = {entry['name']: entry['meaning'] for entry in entries}
+            start = len(self.names)
+            self.names.extend(entries.keys())
+            self.meanings.extend(entries.values())
+            self.ranges[kind] = (start, len(self.names))
+
+        digest = hashlib.sha256()
+        for name, meaning in zip(self.names, self.meanings):
+            digest.update(f'{name}\x1f{meaning}\x1e'.encode('utf-8'))
+        self.version = digest.hexdigest()[:16]
+        self.matrix: Optional[np.ndarray] = None
+        self.ann_index = None
+
+    def entries(self, kind: str) -> Dict[str, str]:
+        start, end = self.ranges[kind]
+        return dict(zip(self.names[start:end], self.meanings[start:end]))
+
+    def build_index(self, encoder, index_dir: str, model_name: str):
+        """Encode every meaning once and write the embedding matrix and its metadata."""
+        embeddings = encoder.encode(self.meanings, convert_to_numpy=True, normalize_embeddings=True,
+                                    show_progress_bar=False)
+        os.makedirs(index_dir, exist_ok=True)
+        # Written under temporary names and renamed into place, metadata last, so a process loading
+        # the index concurrently never memory-maps a partly written matrix
+        suffix = f'.tmp.{os.getpid()}'
+        embeddings_path = os.path.join(index_dir, 'embeddings.npy')
+        with open(embeddings_path + suffix, 'wb') as f:
+            np.save(f, np.ascontiguousarray(embeddings, dtype=np.float32))
+        os.replace(embeddings_path + suffix, embeddings_path)
+        meta_path = os.path.join(index_dir, 'index.json')
+        with open(meta_path + suffix, 'w', encoding='utf-8') as f:
+            json.dump({'lexicon_version': self.version, 'model': model_name,
+                       'count': len(self.names), 'dim': int(embeddings.shape[1])}, f)
+        os.replace(meta_path + suffix, meta_path)
+        logger.info(f"Built lexicon index for {len(self.names)} entries in {index_dir}")
+
+    def load_index(self, index_dir: str, model_name: str) -> bool:
+        """Memory-map a prebuilt index. Returns False if it is missing or stale."""
+        meta_path = os.path.join(index_dir, 'index.json')
+        if not os.path.exists(meta_path):
+            return False
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        if meta.get('lexicon_version') != self.version or meta.get('model') != model_name:
+            logger.warning(f"Lexicon index in {index_dir} is stale; rebuild it with build_lexicon_index.py")
+            return False
+
+        matrix = np.load(os.path.join(index_dir, 'embeddings.npy'), mmap_mode='r')
+        if matrix.shape[0] != len(self.names):
+            logger.warning(f"Lexicon index in {index_dir} has {matrix.shape[0]} rows for {len(self.names)} entries")
+            return False
+        self.matrix = matrix
+        if os.getenv('NLP_LEXICON_ANN') == 'faiss' and len(self.names) >= int(os.getenv('NLP_LEXICON_ANN_MIN_ENTRIES', 20000)):
+            self._build_ann()
+        return True
+
+    @staticmethod
+    @contextmanager
+    def build_lock(index_dir: str):
+        """Exclusive lock for building the index in `index_dir`, so concurrent workers build it once."""
+        if fcntl is None:
+            yield
+            return
+        os.makedirs(index_dir, exist_ok=True)
+        with open(os.path.join(index_dir, '.build.lock'), 'w') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+
+    def _build_ann(self):
+        try:
+            import faiss
+        except ImportError:
+            logger.warning("NLP_LEXICON_ANN=faiss but faiss is not installed; using exact search")
+            return
+        index = faiss.IndexHNSWFlat(self.matrix.shape[1], 32, faiss.METRIC_INNER_PRODUCT)
+        index.add(np.ascontiguousarray(self.matrix))
+        self.ann_index = index
+
+    def match(self, sentences: List[str], sentence_embeddings: np.ndarray, threshold: float,
+              limit: int = 5) -> Dict[str, List[Dict[str, Any]]]:
+        """Best entry of each kind per sentence, keeping each entry's best-scoring sentence."""
+        empty = {kind: [] for kind in KINDS}
+        if not sentences or self.matrix is None or not self.names:
+            return empty
+
+        queries = np.asarray(sentence_embeddings, dtype=np.float32)
+        if self.ann_index is not None:
+            # Approximate: nearest neighbours across the whole lexicon, split by kind below
+            hits = self.ann_index.search(queries, int(os.getenv('NLP_LEXICON_ANN_K', 32)))
+        else:
+            # Exact: one matrix product against themes and symbols together
+            hits = queries @ self.matrix.T
+        return self.select(sentences, hits, threshold, limit, approximate=self.ann_index is not None)
+
+    def select(self, sentences: List[str], hits, threshold: float, limit: int = 5,
+               approximate: bool = False) -> Dict[str, List[Dict[str, Any]]]:
+        """Matches from a (sentences x entries) score matrix, or (scores, ids) nearest neighbours if approximate."""
+        empty = {kind: [] for kind in KINDS}
+        if not sentences or not self.names:
+            return empty
+        best = {}
+        for kind, (start, end) in self.ranges.items():
+            if start == end:
+                continue
+            ids, scores = self._best_per_sentence(hits, start, end, approximate)
+            detected = {}
+            for i, (entry, score) in enumerate(zip(ids, scores)):
+                if entry < 0 or score <= threshold:
+                    continue
+                name = self.names[entry]
+                if name not in detected or score > detected[name]['score']:
+                    detected[name] = {
+                        kind[:-1]: name,
+                        'meaning': self.meanings[entry],
+                        'score': float(score),
+                        'sentence': sentences[i]
+                    }
+            best[kind] = sorted(detected.values(), key=lambda x: x['score'], reverse=True)[:limit]
+        return {**empty, **best}
+
+    def _best_per_sentence(self, hits, start: int, end: int, approximate: bool):
+        if approximate:
+            scores, ids = hits
+            in_kind = (ids >= start) & (ids < end)
+            masked = np.where(in_kind, scores, -np.inf)
+            column = masked.argmax(axis=1)
+            rows = np.arange(len(ids))
+            best_ids = np.where(in_kind[rows, column], ids[rows, column], -1)
+            return best_ids, masked[rows, column]
+
+        scores = hits[:, start:end]
+        column = scores.argmax(axis=1)
+        return column + start, scores[np.arange(len(scores)), column]
+
+
+def lexicon_path() -> str:
+    return os.getenv('NLP_LEXICON_PATH', os.path.join(os.path.dirname(__file__), 'data', 'dream_lexicon.json'))
+
+
+def lexicon_index_dir() -> str:
+    return os.getenv('NLP_LEXICON_INDEX_DIR', os.path.join(os.path.dirname(__file__), 'data', 'lexicon_index'))
@@ -0,0 +1,369 @@
+import os
+import glob
+import json
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+CHARS_BUCKETS = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 100000)
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+logger = logging.getLogger(__name__)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            if key not in self._children:
+                self._children[key] = self._new_child()
+            return self._children[key]
+
+    def _default(self):
+        return self.labels(**{}) if not self.labelnames else None
+
+    def snapshot(self) -> Dict[Tuple[str, ...], object]:
+        """This process's value per label set, in a JSON-serializable form."""
+        with self._lock:
+            children = list(self._children.items())
+        return {key: self._values(child) for key, child in children}
+
+    def render(self, values: Optional[Dict[Tuple[str, ...], object]] = None) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for key, child_values in (self.snapshot() if values is None else values).items():
+            lines.extend(self._render_values(key, child_values))
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def set(self, value: float):
+        with self._lock:
+            self.value = value
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def _values(self, child):
+        return child.value
+
+    @staticmethod
+    def _merge(a, b):
+        return a + b
+
+    def _render_values(self, key, value):
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}']
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def dec(self, amount: float = 1.0):
+        self._default().dec(amount)
+
+
+class _HistogramValue:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.sum += value
+            self.count += 1
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self.counts[i] += 1
+                    break
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def _values(self, child):
+        with child._lock:
+            return [list(child.counts), child.sum, child.count]
+
+    @staticmethod
+    def _merge(a, b):
+        return [[x + y for x, y in zip(a[0], b[0])], a[1] + b[1], a[2] + b[2]]
+
+    def _render_values(self, key, values):
+        counts, total, count = values
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, ("le", _format_value(bound)))} {cumulative}')
+        lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, ("le", "+Inf"))} {count}')
+        lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}')
+        lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {count}')
+        return lines
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class MetricsRegistry:
+    """Minimal Prometheus text-format registry (no client library dependency).
+
+    Values are per process. With `share(directory)`, each process (e.g. each
+    gunicorn worker) writes a snapshot of its values to `directory` every few
+    seconds and render() aggregates them all: counters and histograms are
+    summed over every snapshot, including exited processes', and gauges over
+    live processes. Collector lines still describe only the process rendering.
+    """
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[str]]] = []
+        self._share_dir = None
+        self._share_interval = 5.0
+        self._writer_pid = None
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._add(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector: Callable[[], Iterable[str]]):
+        """Register a callable producing exposition lines at scrape time."""
+        self._collectors.append(collector)
+
+    def share(self, directory: str, interval: float = 5.0):
+        """Aggregate metrics across the processes sharing `directory` (clear it when the server starts)."""
+        os.makedirs(directory, exist_ok=True)
+        self._share_dir = directory
+        self._share_interval = interval
+
+    def start_writer(self):
+        """Start this process's snapshot writer (render() also does); call in each process after fork."""
+        if not self._share_dir or self._writer_pid == os.getpid():
+            return
+        self._writer_pid = os.getpid()
+        threading.Thread(target=self._write_snapshots, name='metrics-writer', daemon=True).start()
+
+    def _write_snapshots(self):
+        while True:
+            time.sleep(self._share_interval)
+            try:
+                self._write_snapshot()
+            except OSError as e:
+                logger.error(f"Writing the metrics snapshot to {self._share_dir} failed: {e}")
+
+    def _write_snapshot(self):
+        path = os.path.join(self._share_dir, f'metrics.{os.getpid()}.json')
+        snapshot = {metric.name: [[list(key), values] for key, values in metric.snapshot().items()]
+                    for metric in self._metrics}
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(f'{path}.tmp', path)
+
+    def _aggregate(self) -> Dict[str, Dict[Tuple[str, ...], object]]:
+        self._write_snapshot()
+        kinds = {metric.name: metric for metric in self._metrics}
+        merged: Dict[str, Dict[Tuple[str, ...], object]] = {name: {} for name in kinds}
+        for path in glob.glob(os.path.join(self._share_dir, 'metrics.*.json')):
+            try:
+                pid = int(os.path.basename(path).split('.')[1])
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping unreadable metrics snapshot {path}: {e}")
+                continue
+            alive = _process_alive(pid)
+            for name, children in snapshot.items():
+                metric = kinds.get(name)
+                if metric is None or (metric.kind == 'gauge' and not alive):
+                    continue
+                for key, values in children:
+                    key = tuple(key)
+                    current = merged[name].get(key)
+                    merged[name][key] = values if current is None else metric._merge(current, values)
+        return merged
+
+    def render(self) -> str:
+        lines = []
+        merged = None
+        if self._share_dir:
+            self.start_writer()
+            try:
+                merged = self._aggregate()
+            except OSError as e:
+                logger.error(f"Aggregating metrics from {self._share_dir} failed: {e}")
+        for metric in self._metrics:
+            lines.extend(metric.render(merged[metric.name] if merged is not None else None))
+        for collector in self._collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram('nlp_stage_duration_seconds', 'Time spent in a DreamAnalyzer stage.', ['stage'])
+STAGE_INPUT_CHARS = REGISTRY.histogram('nlp_stage_input_chars', 'Characters of input per stage call.', ['stage'],
+                                       buckets=CHARS_BUCKETS)
+STAGE_ERRORS = REGISTRY.counter('nlp_stage_errors_total', 'Stage calls that raised.', ['stage'])
+FALLBACKS = REGISTRY.counter('nlp_fallbacks_total', 'Stage results served by a fallback instead of a model.',
+                             ['stage', 'reason'])
+MODEL_SECONDS = REGISTRY.histogram('nlp_model_call_duration_seconds', 'Time spent in one model call.', ['model'])
+MODEL_BATCH_SIZE = REGISTRY.histogram('nlp_model_batch_size', 'Inputs per model call.', ['model'],
+                                      buckets=BATCH_BUCKETS)
+MODEL_ERRORS = REGISTRY.counter('nlp_model_errors_total', 'Model calls that raised.', ['model'])
+REQUEST_SECONDS = REGISTRY.histogram('nlp_request_duration_seconds', 'HTTP request latency.', ['endpoint', 'status'])
+REQUESTS_IN_FLIGHT = REGISTRY.gauge('nlp_requests_in_flight', 'HTTP requests currently being handled.', ['endpoint'])
+
+# With several HTTP worker processes, /metrics aggregates them through this directory (see gunicorn.conf.py)
+if os.getenv('NLP_METRICS_DIR'):
+    REGISTRY.share(os.getenv('NLP_METRICS_DIR'))
+
+# Per-request stage timings (ms), returned in the response metadata
+_request_timings: contextvars.ContextVar = contextvars.ContextVar('request_timings', default=None)
+_active_stage: contextvars.ContextVar = contextvars.ContextVar('active_stage', default=None)
+
+
+def start_request_timings() -> Dict[str, float]:
+    timings = {}
+    _request_timings.set(timings)
+    return timings
+
+
+def request_timings() -> Dict[str, float]:
+    return dict(_request_timings.get() or {})
+
+
+def _input_chars(args) -> int:
+    if not args:
+        return 0
+    value = args[0]
+    if isinstance(value, str):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return sum(len(v) for v in value if isinstance(v, str))
+    return 0
+
+
+def timed_stage(stage: str):
+    """Record latency, input size and errors of a stage method.
+
+    Calls nested inside another timed stage (e.g. a single-text method
+    delegating to its batch variant) are attributed to the outer stage only.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(self, *args, **kwargs):
+            if _active_stage.get() is not None:
+                return fn(self, *args, **kwargs)
+            token = _active_stage.set(stage)
+            start = time.perf_counter()
+            try:
+                return fn(self, *args, **kwargs)
+            except Exception:
+                STAGE_ERRORS.labels(stage=stage).inc()
+                raise
+            finally:
+                elapsed = time.perf_counter() - start
+                _active_stage.reset(token)
+                STAGE_SECONDS.labels(stage=stage).observe(elapsed)
+                STAGE_INPUT_CHARS.labels(stage=stage).observe(_input_chars(args))
+                timings = _request_timings.get()
+                if timings is not None:
+                    timings[stage] = round(timings.get(stage, 0.0) + elapsed * 1000, 3)
+        return wrapper
+    return decorator
+
+
+@contextmanager
+def observe_model(model: str, batch_size: int):
+    """Time one model call and record how many inputs it covered."""
+    MODEL_BATCH_SIZE.labels(model=model).observe(batch_size)
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        MODEL_ERRORS.labels(model=model).inc()
+        raise
+    finally:
+        MODEL_SECONDS.labels(model=model).observe(time.perf_counter() - start)
+
+
+def fallback(stage: str, reason: str):
+    FALLBACKS.labels(stage=stage, reason=reason).inc()
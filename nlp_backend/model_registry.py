@@ -0,0 +1,75 @@
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    """Loads models on first use (or explicit warmup) and tracks their load state.
+
+    A failed load is remembered so request threads do not retry it on every
+    call; `warmup` retries it explicitly.
+    """
+
+    def __init__(self):
+        self._loaders: Dict[str, Callable[[], Any]] = {}
+        self._models: Dict[str, Any] = {}
+        self._status: Dict[str, Dict[str, Any]] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+
+    def register(self, name: str, loader: Callable[[], Any]):
+        self._loaders[name] = loader
+        self._locks[name] = threading.Lock()
+        self._status[name] = {'state': 'not_loaded', 'load_seconds': None, 'error': None}
+
+    def names(self):
+        return list(self._loaders)
+
+    def get(self, name: str) -> Optional[Any]:
+        """Return the loaded model, loading it now if needed. None if it failed to load."""
+        if name in self._models:
+            return self._models[name]
+        if self._status[name]['state'] == 'failed':
+            return None
+        return self._load(name)
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._models
+
+    def warmup(self, names: Optional[Iterable[str]] = None) -> Dict[str, Dict[str, Any]]:
+        for name in names or self.names():
+            if name not in self._loaders:
+                logger.warning(f"Unknown model requested for warmup: {name}")
+                continue
+            if name not in self._models:
+                self._load(name)
+        return self.status()
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        return {name: dict(status) for name, status in self._status.items()}
+
+    def _load(self, name: str) -> Optional[Any]:
+        with self._locks[name]:
+            if name in self._models:
+                return self._models[name]
+
+            self._status[name].update({'state': 'loading', 'error': None})
+            start = time.perf_counter()
+            try:
+                model = self._loaders[name]()
+            except Exception as e:
+                logger.error(f"Error loading model {name}: {e}")
+                self._status[name].update({
+                    'state': 'failed',
+                    'load_seconds': round(time.perf_counter() - start, 3),
+                    'error': str(e)
+                })
+                return None
+
+            elapsed = round(time.perf_counter() - start, 3)
+            self._models[name] = model
+            self._status[name].update({'state': 'loaded', 'load_seconds': elapsed})
+            logger.info(f"Model {name} loaded in {elapsed}s")
+            return model
@@ -0,0 +1,288 @@
+"""Re-run the NLP analysis over stored dreams and write the results back in bulk.
+
+    python reanalyze.py --source supabase [--user-id UUID] [--only-stale]
+    python reanalyze.py --source dreams.jsonl --out reanalyzed.jsonl
+    python reanalyze.py --source dreams.db            # SQLite table `dreams`, updated in place
+
+Dreams are read a page at a time in a stable order and analyzed in batches,
+so memory stays bounded however many dreams there are. After every batch is
+written, the last processed key is saved to the checkpoint file; rerunning the
+same command resumes after it (--restart starts over). Use it after a model or
+lexicon upgrade, instead of calling /analyze once per dream. Writing back to
+Supabase needs the update_dream_analyses function from
+supabase/migrations/create_update_dream_analyses_rpc.sql.
+"""
+import os
+import json
+import time
+import sqlite3
+import logging
+import argparse
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger('reanalyze')
+
+DREAM_COLUMNS = ('id', 'user_id', 'title', 'content', 'analysis')
+
+
+class SupabaseSource:
+    """The `dreams` table, paged by id (keyset pagination, so resuming is exact)."""
+
+    def __init__(self, client, user_id: Optional[str] = None):
+        self.client = client
+        self.user_id = user_id
+        self.name = f"supabase:dreams{':' + user_id if user_id else ''}"
+
+    def _query(self, columns: str, **kwargs):
+        query = self.client.table('dreams').select(columns, **kwargs)
+        return query.eq('user_id', self.user_id) if self.user_id else query
+
+    def count(self) -> Optional[int]:
+        return self._query('id', count='exact').limit(1).execute().count
+
+    def pages(self, after: Optional[str], page_size: int) -> Iterator[List[Dict[str, Any]]]:
+        while True:
+            query = self._query(', '.join(DREAM_COLUMNS)).order('id').limit(page_size)
+            if after is not None:
+                query = query.gt('id', after)
+            rows = query.execute().data or []
+            if not rows:
+                return
+            yield rows
+            after = rows[-1]['id']
+
+    def write(self, rows: List[Dict[str, Any]]):
+        # One call per batch that sets only the analysis column (see the update_dream_analyses migration),
+        # so title/content the user edits while the job runs stay theirs
+        updated = self.client.rpc('update_dream_analyses', {
+            'updates': [{'id': row['id'], 'analysis': row['analysis']} for row in rows]
+        }).execute().data
+        if isinstance(updated, int) and updated < len(rows):
+            logger.warning(f"{len(rows) - updated} of {len(rows)} dreams were deleted before their analysis was written")
+
+
+class SQLiteSource:
+    """A local stand-in: table `dreams` with the Supabase columns (analysis as JSON text)."""
+
+    def __init__(self, path: str, user_id: Optional[str] = None):
+        self.path = path
+        self.user_id = user_id
+        self.name = f"sqlite:{os.path.abspath(path)}{':' + user_id if user_id else ''}"
+        self.conn = sqlite3.connect(path)
+        self.conn.row_factory = sqlite3.Row
+
+    def _where(self, after) -> tuple:
+        clauses, params = [], []
+        if self.user_id:
+            clauses.append('user_id = ?')
+            params.append(self.user_id)
+        if after is not None:
+            clauses.append('id > ?')
+            params.append(after)
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    def count(self) -> Optional[int]:
+        where, params = self._where(None)
+        return self.conn.execute(f'SELECT COUNT(*) FROM dreams{where}', params).fetchone()[0]
+
+    def pages(self, after: Optional[str], page_size: int) -> Iterator[List[Dict[str, Any]]]:
+        while True:
+            where, params = self._where(after)
+            rows = [dict(row) for row in self.conn.execute(
+                f"SELECT {', '.join(DREAM_COLUMNS)} FROM dreams{where} ORDER BY id LIMIT ?", params + [page_size]
+            )]
+            if not rows:
+                return
+            for row in rows:
+                row['analysis'] = _parse_analysis(row.get('analysis'))
+            yield rows
+            after = rows[-1]['id']
+
+    def write(self, rows: List[Dict[str, Any]]):
+        with self.conn:
+            self.conn.executemany('UPDATE dreams SET analysis = ? WHERE id = ?',
+                                  [(json.dumps(row['analysis']), row['id']) for row in rows])
+
+
+class JSONLSource:
+    """A local stand-in: one dream object per line, keyed by line number; results go to --out."""
+
+    def __init__(self, path: str, out: str, user_id: Optional[str] = None):
+        self.path = path
+        self.out = out
+        self.user_id = user_id
+        self.name = f"jsonl:{os.path.abspath(path)}{':' + user_id if user_id else ''}"
+
+    def count(self) -> Optional[int]:
+        with open(self.path, encoding='utf-8') as f:
+            return sum(1 for line in f if line.strip())
+
+    def pages(self, after: Optional[int], page_size: int) -> Iterator[List[Dict[str, Any]]]:
+        page = []
+        with open(self.path, encoding='utf-8') as f:
+            for line_number, line in enumerate(f):
+                if (after is not None and line_number <= after) or not line.strip():
+                    continue
+                row = json.loads(line)
+                if self.user_id and row.get('user_id') != self.user_id:
+                    continue
+                row['analysis'] = _parse_analysis(row.get('analysis'))
+                row['_key'] = line_number
+                page.append(row)
+                if len(page) == page_size:
+                    yield page
+                    page = []
+        if page:
+            yield page
+
+    def write(self, rows: List[Dict[str, Any]]):
+        with open(self.out, 'a', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps({k: v for k, v in row.items() if k != '_key'}) + '\n')
+
+
+def _parse_analysis(value) -> Optional[Dict[str, Any]]:
+    if isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return None
+    return value
+
+
+def _key(row: Dict[str, Any]):
+    return row.get('_key', row.get('id'))
+
+
+class Checkpoint:
+    """Last processed key and running totals, rewritten atomically after every batch."""
+
+    def __init__(self, path: str, source_name: str, restart: bool = False):
+        self.path = path
+        self.state = {'source': source_name, 'after': None, 'processed': 0, 'failed': 0, 'skipped': 0}
+        if not restart and os.path.exists(path):
+            with open(path) as f:
+                saved = json.load(f)
+            if saved.get('source') == source_name:
+                self.state = saved
+                logger.info(f"Resuming after {saved['after']!r} ({saved['processed']} dreams already done)")
+            else:
+                logger.warning(f"Checkpoint {path} is for {saved.get('source')}; starting over")
+
+    def save(self):
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump({**self.state, 'updated_at': datetime.now().isoformat()}, f)
+        os.replace(tmp, self.path)
+
+
+def analysis_version(app_module) -> str:
+    """Identifies the models, analyzer logic and lexicon that produced an analysis.
+
+    Uses the backend the models actually loaded on, so call it after they are loaded.
+    """
+    return f"{app_module.ANALYZER_VERSION}/{app_module.effective_backend()}/{app_module.dream_analyzer.lexicon.version}"
+
+
+def reanalyze(source, checkpoint: Checkpoint, app_module, batch_size: int, page_size: int,
+              only_stale: bool = False, limit: Optional[int] = None, dry_run: bool = False):
+    # Load the backend-dependent models first: a fallback to fp32 changes the version
+    app_module.models.warmup(['emotion_classifier', 'sentiment_analyzer', 'sentence_transformer'])
+    version = analysis_version(app_module)
+    total = source.count()
+    state = checkpoint.state
+    started = time.perf_counter()
+    done_this_run = 0
+
+    for page in source.pages(state['after'], page_size):
+        for start in range(0, len(page), batch_size):
+            batch = page[start:start + batch_size]
+            if limit is not None:
+                batch = batch[:max(0, limit - done_this_run)]
+                if not batch:
+                    return
+
+            pending = [row for row in batch if len(row.get('content') or '') >= 10 and not (
+                only_stale and (row.get('analysis') or {}).get('analysis_version') == version)]
+            state['skipped'] += len(batch) - len(pending)
+
+            updated = []
+            if pending:
+                analyses = app_module.analyze_contents([row['content'] for row in pending])
+                unavailable = next((error for _, error in analyses
+                                    if isinstance(error, app_module.StageUnavailable)), None)
+                if unavailable is not None:
+                    # Every dream would fail the same way; stop before the checkpoint moves past them
+                    raise SystemExit(f"Stopping: {unavailable}. Nothing from this batch was written.")
+                for row, (analysis, error) in zip(pending, analyses):
+                    if error is not None:
+                        logger.error(f"Dream {row.get('id')} failed: {error}")
+                        state['failed'] += 1
+                        continue
+                    # Keep fields other producers stored (e.g. title, video_prompt); replace the NLP ones
+                    row['analysis'] = {**(row.get('analysis') or {}), **analysis,
+                                       'analysis_version': version,
+                                       'analyzed_at': datetime.now().isoformat()}
+                    updated.append(row)
+            if updated and not dry_run:
+                source.write(updated)
+
+            state['processed'] += len(updated)
+            state['after'] = _key(batch[-1])
+            done_this_run += len(batch)
+            if not dry_run:
+                checkpoint.save()
+
+            elapsed = time.perf_counter() - started
+            rate = done_this_run / elapsed if elapsed else 0.0
+            seen = state['processed'] + state['failed'] + state['skipped']
+            eta = f", ETA {(total - seen) / rate / 60:.1f} min" if total and rate else ''
+            logger.info(f"{seen}/{total if total is not None else '?'} dreams "
+                        f"({state['processed']} updated, {state['failed']} failed, {state['skipped']} skipped) "
+                        f"{rate:.2f} dreams/s{eta}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--source', default='supabase',
+                        help="'supabase', a .jsonl file or a SQLite database with a dreams table")
+    parser.add_argument('--out', help='output JSONL file (required for a .jsonl source)')
+    parser.add_argument('--user-id', help='only this user\'s dreams')
+    parser.add_argument('--batch-size', type=int, default=32, help='dreams per analysis batch')
+    parser.add_argument('--page-size', type=int, default=500, help='dreams read per page')
+    parser.add_argument('--checkpoint', help='checkpoint file (default: derived from the source)')
+    parser.add_argument('--restart', action='store_true', help='ignore an existing checkpoint')
+    parser.add_argument('--only-stale', action='store_true',
+                        help='skip dreams already analyzed by the current models and lexicon')
+    parser.add_argument('--limit', type=int, help='stop after this many dreams')
+    parser.add_argument('--dry-run', action='store_true', help='analyze but write neither results nor checkpoint')
+    args = parser.parse_args()
+
+    import app as app_module
+    # Per-request INFO lines from the analyzer would drown out the progress lines
+    logging.getLogger('app').setLevel(logging.WARNING)
+    logger.setLevel(logging.INFO)
+
+    if args.source == 'supabase':
+        if app_module.supabase is None:
+            parser.error('SUPABASE_URL and SUPABASE_SERVICE_KEY must be set')
+        source = SupabaseSource(app_module.supabase, args.user_id)
+    elif args.source.endswith('.jsonl'):
+        if not args.out:
+            parser.error('--out is required for a JSONL source')
+        source = JSONLSource(args.source, args.out, args.user_id)
+    else:
+        source = SQLiteSource(args.source, args.user_id)
+
+    checkpoint_path = args.checkpoint or (
+        'reanalyze.checkpoint.json' if args.source == 'supabase' else f'{args.source}.checkpoint.json')
+    checkpoint = Checkpoint(checkpoint_path, source.name, restart=args.restart)
+    reanalyze(source, checkpoint, app_module, args.batch_size, args.page_size,
+              only_stale=args.only_stale, limit=args.limit, dry_run=args.dry_run)
+    state = checkpoint.state
+    logger.info(f"Done: {state['processed']} updated, {state['failed']} failed, {state['skipped']} skipped")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+import os
+import json
+import time
+import atexit
+import base64
+import sqlite3
+import hashlib
+import logging
+import threading
+import unicodedata
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_content(text: str) -> str:
+    """Normalize text so trivially different submissions share a cache entry."""
+    return ' '.join(unicodedata.normalize('NFC', text).split())
+
+
+def pack_vector(vector) -> str:
+    """Compact JSON-safe form of a float vector (base64 float32) for caching."""
+    return base64.b64encode(np.asarray(vector, dtype=np.float32).tobytes()).decode('ascii')
+
+
+def unpack_vector(value: str) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(value), dtype=np.float32)
+
+
+class ResultCache:
+    """Content-addressed cache for analysis stage results.
+
+    Entries live in a bounded in-memory LRU with a TTL, backed by an optional
+    SQLite tier (`db_path`) that survives restarts. Values must be
+    JSON-serializable to be written to the persistent tier. Writes to it are
+    buffered and committed together (every `write_batch` entries or
+    `write_interval` seconds, and at exit) outside the cache lock, and rows
+    older than the TTL are deleted every `purge_interval` seconds. Caches
+    sharing a database should share the TTL, since the shortest one purges.
+    """
+
+    def __init__(self, max_entries: int = 2048, ttl_seconds: float = 3600, db_path: Optional[str] = None,
+                 write_batch: int = 64, write_interval: float = 1.0, purge_interval: float = 3600):
+        self.max_entries = max(0, int(max_entries))
+        self.ttl = float(ttl_seconds)
+        self.db_path = db_path
+        self.write_batch = max(1, int(write_batch))
+        self.write_interval = write_interval
+        self.purge_interval = purge_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Serializes use of the shared SQLite connection; never taken while waiting on _lock
+        self._db_lock = threading.Lock()
+        self._pending: Dict[str, Tuple[str, float]] = {}
+        self._last_flush = time.time()
+        self._last_purge = 0.0
+        self._db = None
+        self._db_pid = None
+        self._stats = defaultdict(lambda: {'hits': 0, 'misses': 0})
+        self._evictions = 0
+        self._disk_hits = 0
+        if db_path:
+            atexit.register(self.flush)
+
+    @staticmethod
+    def key(stage: str, content: str, model: str = '', version: str = '') -> str:
+        payload = '\x1f'.join([stage, model, version, normalize_content(content)])
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, stage: str, key: str) -> Tuple[bool, Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, value = entry
+                if now - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self._stats[stage]['hits'] += 1
+                    return True, value
+                del self._entries[key]
+            pending = self._pending.get(key)
+
+        # The persistent tier is read without holding the cache lock
+        if pending is not None and now - pending[1] <= self.ttl:
+            value = json.loads(pending[0])
+        else:
+            value = self._db_get(key, now)
+        with self._lock:
+            if value is not None:
+                self._disk_hits += 1
+                self._stats[stage]['hits'] += 1
+                self._remember(key, value, now)
+                return True, value
+
+            self._stats[stage]['misses'] += 1
+            return False, None
+
+    def set(self, stage: str, key: str, value: Any):
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            if not self.db_path:
+                return
+            try:
+                self._pending[key] = (json.dumps(value), now)
+            except (TypeError, ValueError) as e:
+                logger.error(f"Result cache write error: {e}")
+                return
+            due = len(self._pending) >= self.write_batch or now - self._last_flush >= self.write_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Commit the buffered writes in one transaction, purging expired rows when due."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.time()
+        if not self.db_path:
+            return
+        with self._db_lock:
+            self._db_write(pending)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {stage: dict(counts) for stage, counts in self._stats.items()}
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl,
+                'persistent': bool(self.db_path),
+                'pending_writes': len(self._pending),
+                'hits': sum(s['hits'] for s in stages.values()),
+                'misses': sum(s['misses'] for s in stages.values()),
+                'disk_hits': self._disk_hits,
+                'evictions': self._evictions,
+                'stages': stages,
+            }
+
+    def _remember(self, key: str, value: Any, now: float):
+        if self.max_entries == 0:
+            return
+        self._entries[key] = (now, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    def _connection(self):
+        # SQLite connections must not be shared across a fork
+        if self._db is None or self._db_pid != os.getpid():
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)'
+            )
+            self._db.execute('CREATE INDEX IF NOT EXISTS idx_results_stored_at ON results(stored_at)')
+            self._db_pid = os.getpid()
+        return self._db
+
+    def _db_get(self, key: str, now: float) -> Any:
+        if not self.db_path:
+            return None
+        try:
+            with self._db_lock:
+                row = self._connection().execute(
+                    'SELECT value, stored_at FROM results WHERE key = ?', (key,)
+                ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                return None
+            return json.loads(row[0])
+        except Exception as e:
+            logger.error(f"Result cache read error: {e}")
+            return None
+
+    def _db_write(self, pending: Dict[str, Tuple[str, float]]):
+        now = time.time()
+        purge = now - self._last_purge >= self.purge_interval
+        if not pending and not purge:
+            return
+        try:
+            db = self._connection()
+            db.executemany(
+                'INSERT OR REPLACE INTO results (key, value, stored_at) VALUES (?, ?, ?)',
+                [(key, value, stored_at) for key, (value, stored_at) in pending.items()]
+            )
+            if purge:
+                self._last_purge = now
+                purged = db.execute('DELETE FROM results WHERE stored_at < ?', (now - self.ttl,)).rowcount
+                if purged:
+                    logger.info(f"Result cache purged {purged} expired rows")
+            db.commit()
+        except Exception as e:
+            logger.error(f"Result cache write error: {e}")
+
+
+def cache_from_env(prefix: str = 'NLP_CACHE', default_max_entries: int = 2048) -> ResultCache:
+    """Build a ResultCache configured by <prefix>_MAX_ENTRIES / _TTL_SECONDS / _DB.
+
+    TTL and database default to the NLP_CACHE_* settings, so secondary caches
+    share the persistent tier unless configured otherwise.
+    """
+    def setting(name: str, default=None):
+        return os.getenv(f'{prefix}_{name}') or os.getenv(f'NLP_CACHE_{name}') or default
+
+    return ResultCache(
+        max_entries=int(os.getenv(f'{prefix}_MAX_ENTRIES', default_max_entries)),
+        ttl_seconds=float(setting('TTL_SECONDS', 3600)),
+        db_path=setting('DB'),
+    )
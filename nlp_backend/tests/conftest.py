@@ -0,0 +1,18 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app_module():
+    """The app with the bench stub models (no model downloads), caches off."""
+    from bench.suite import load_app
+    return load_app(stub=True, cache=False, stub_cost={})
+
+
+@pytest.fixture
+def client(app_module):
+    return app_module.app.test_client()
@@ -0,0 +1,19 @@
+from bench import load_corpus
+
+
+def test_long_dream_summary_is_a_few_sentences(app_module):
+    text = ' '.join(load_corpus() * 3)
+    assert len(text) > 10000
+    assert len(app_module.dream_analyzer._sentence_windows(text)) <= app_module.MAX_WINDOWS
+
+    summary = app_module.dream_analyzer.analyze_lite(text)['summary']
+
+    assert summary
+    assert len(summary.split()) <= 80
+    assert len(app_module.nltk.sent_tokenize(summary)) <= 3
+
+
+def test_lite_summary_keeps_short_dream_sentences(app_module):
+    text = 'I was flying over the ocean. The water was dark. Then I woke up happy.'
+    summary = app_module.dream_analyzer.analyze_lite(text)['summary']
+    assert summary in text
@@ -0,0 +1,80 @@
+import reanalyze
+
+CONTENT = 'I was swimming in a warm sea with glowing fish around me.'
+
+
+class FakeResult:
+    def __init__(self, data=None, count=None):
+        self.data = data
+        self.count = count
+
+
+class FakeQuery:
+    """Just enough of the supabase query builder for SupabaseSource's reads."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.after = None
+        self.limit_count = None
+
+    def select(self, columns, count=None):
+        return self
+
+    def eq(self, column, value):
+        return self
+
+    def order(self, column):
+        return self
+
+    def gt(self, column, value):
+        self.after = value
+        return self
+
+    def limit(self, count):
+        self.limit_count = count
+        return self
+
+    def execute(self):
+        rows = [row for row in self.rows if self.after is None or row['id'] > self.after]
+        return FakeResult(data=rows[:self.limit_count], count=len(self.rows))
+
+
+class FakeRpc:
+    def __init__(self, client, name, params):
+        self.client, self.name, self.params = client, name, params
+
+    def execute(self):
+        self.client.rpc_calls.append((self.name, self.params))
+        return FakeResult(data=len(self.params['updates']))
+
+
+class FakeClient:
+    def __init__(self, rows):
+        self.rows = rows
+        self.rpc_calls = []
+
+    def table(self, name):
+        assert name == 'dreams'
+        return FakeQuery(self.rows)
+
+    def rpc(self, name, params):
+        return FakeRpc(self, name, params)
+
+
+def test_supabase_results_are_written_once_per_batch(app_module, tmp_path):
+    rows = [{'id': f'{i:04d}', 'user_id': 'u1', 'title': None, 'content': f'{CONTENT} Night {i}.',
+             'analysis': {'title': 'kept'}} for i in range(10)]
+    client = FakeClient(rows)
+    source = reanalyze.SupabaseSource(client)
+    checkpoint = reanalyze.Checkpoint(str(tmp_path / 'checkpoint.json'), source.name)
+
+    reanalyze.reanalyze(source, checkpoint, app_module, batch_size=4, page_size=8)
+
+    # Pages of 8 in batches of 4: batches of 4, 4 and 2
+    assert [len(params['updates']) for _, params in client.rpc_calls] == [4, 4, 2]
+    assert all(name == 'update_dream_analyses' for name, _ in client.rpc_calls)
+    written = [update for _, params in client.rpc_calls for update in params['updates']]
+    assert [update['id'] for update in written] == [row['id'] for row in rows]
+    assert set(written[0]) == {'id', 'analysis'}
+    assert written[0]['analysis']['title'] == 'kept'
+    assert checkpoint.state['processed'] == 10
@@ -0,0 +1,22 @@
+import pytest
+
+BODY_ENDPOINTS = ['/analyze', '/analyze-stream', '/analyze-batch', '/similar-dreams', '/index-dream',
+                  '/index-journal', '/extract-keywords', '/analyze-emotions', '/warmup']
+
+
+@pytest.mark.parametrize('endpoint', BODY_ENDPOINTS)
+@pytest.mark.parametrize('body', ['{"content": ', '[1, 2]', '"text"'])
+def test_malformed_or_non_object_body_is_400(client, endpoint, body):
+    response = client.post(endpoint, data=body, content_type='application/json')
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('tier', ['full', 'lite'])
+def test_analyze_tiers_reject_non_string_content(client, tier):
+    assert client.post('/analyze', json={'content': 123, 'tier': tier}).status_code == 400
+
+
+def test_analyze_full_tier(client):
+    response = client.post('/analyze', json={'content': 'I was flying over a dark ocean and felt free.'})
+    assert response.status_code == 200
+    assert response.json['success']
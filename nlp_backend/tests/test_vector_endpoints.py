@@ -0,0 +1,40 @@
+import pytest
+
+CONTENT = 'I was walking through an old house full of doors.'
+
+
+@pytest.mark.parametrize('body', [
+    {'user_id': 'u1', 'dream_id': 'd1', 'content': 123},
+    {'user_id': 'u1', 'dream_id': 'd1', 'content': ['a dream in a list']},
+    {'user_id': 42, 'dream_id': 'd1', 'content': CONTENT},
+    {'user_id': 'u1', 'dream_id': {'id': 1}, 'content': CONTENT},
+])
+def test_index_dream_rejects_bad_types(client, body):
+    assert client.post('/index-dream', json=body).status_code == 400
+
+
+@pytest.mark.parametrize('body', [
+    {'user_id': 'u1', 'content': 123},
+    {'user_id': 'u1', 'content': CONTENT, 'k': 'five'},
+    {'user_id': 'u1', 'content': CONTENT, 'k': 0},
+    {'user_id': 'u1', 'content': CONTENT, 'k': True},
+    {'user_id': ['u1'], 'content': CONTENT},
+])
+def test_similar_dreams_rejects_bad_types(client, body):
+    assert client.post('/similar-dreams', json=body).status_code == 400
+
+
+def test_index_then_search(client):
+    assert client.post('/index-dream', json={'user_id': 'u-test', 'dream_id': 'd1', 'content': CONTENT}).status_code == 200
+    response = client.post('/similar-dreams', json={'user_id': 'u-test', 'content': CONTENT, 'k': 3})
+    assert response.status_code == 200
+    assert response.json['indexed_dreams'] == 1
+
+
+def test_index_dream_store_failure_is_json_500(client, app_module, monkeypatch):
+    def fail(*args, **kwargs):
+        raise OSError('disk full')
+    monkeypatch.setattr(app_module.vector_store, 'remove', fail)
+    response = client.delete('/index-dream', json={'user_id': 'u1', 'dream_id': 'd1'})
+    assert response.status_code == 500
+    assert response.json['error'] == 'disk full'
@@ -0,0 +1,206 @@
+import os
+import re
+import json
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # not POSIX: only one process may write an index
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class _UserIndex:
+    """One user's dream vectors: an append-only float32 file plus a JSONL row log.
+
+    Several processes (gunicorn workers) may share the files: every operation
+    first reads log lines other processes appended and notices a grown vector
+    file, and writes hold an exclusive file lock so row numbers never collide.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.vectors_path = os.path.join(path, 'vectors.f32')
+        self.rows_path = os.path.join(path, 'rows.jsonl')
+        self.meta_path = os.path.join(path, 'meta.json')
+        self.dim: Optional[int] = None
+        self.rows: List[Optional[Dict[str, Any]]] = []  # row -> dream info, None once removed
+        self.row_of: Dict[str, int] = {}
+        self._matrix = None
+        self._alive = None
+        self._rows_offset = 0
+        self._vectors_size = 0
+        self.refresh()
+
+    def refresh(self):
+        """Pick up rows and vectors written since the last call, by this or another process."""
+        if self.dim is None and os.path.exists(self.meta_path):
+            with open(self.meta_path, encoding='utf-8') as f:
+                self.dim = json.load(f)['dim']
+        if os.path.exists(self.rows_path) and os.path.getsize(self.rows_path) > self._rows_offset:
+            with open(self.rows_path, 'rb') as f:
+                f.seek(self._rows_offset)
+                data = f.read()
+            # A line another process is still writing is read next time
+            complete = data[:data.rfind(b'\n') + 1]
+            for line in complete.decode('utf-8').splitlines():
+                if line.strip():
+                    self._apply(json.loads(line))
+            self._rows_offset += len(complete)
+            self._alive = None
+        size = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+        if size != self._vectors_size:
+            self._vectors_size = size
+            self._matrix = None
+
+    @contextmanager
+    def writing(self):
+        """Exclusive across processes; the index is refreshed first so row numbers are current."""
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, '.lock'), 'w') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self.refresh()
+            yield
+
+    def _apply(self, entry: Dict[str, Any]):
+        row = entry['row']
+        while len(self.rows) <= row:
+            self.rows.append(None)
+        if entry.get('deleted'):
+            self.rows[row] = None
+            self.row_of.pop(entry['dream_id'], None)
+        else:
+            self.rows[row] = {'dream_id': entry['dream_id'], 'title': entry.get('title')}
+            self.row_of[entry['dream_id']] = row
+
+    def _log(self, entry: Dict[str, Any]):
+        with open(self.rows_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+        self.refresh()
+
+    def alive(self, size: int) -> np.ndarray:
+        """Which of the first `size` rows hold a dream; rows not in the log yet do not."""
+        if self._alive is None:
+            self._alive = np.array([info is not None for info in self.rows], dtype=bool)
+        mask = np.zeros(size, dtype=bool)
+        mask[:min(size, len(self._alive))] = self._alive[:size]
+        return mask
+
+    def matrix(self) -> np.ndarray:
+        if self._matrix is None:
+            if self.dim is None or not os.path.exists(self.vectors_path) or os.path.getsize(self.vectors_path) == 0:
+                return np.zeros((0, self.dim or 0), dtype=np.float32)
+            self._matrix = np.memmap(self.vectors_path, dtype=np.float32, mode='r').reshape(-1, self.dim)
+        return self._matrix
+
+    def upsert(self, dream_id: str, vector: np.ndarray, title: Optional[str]):
+        if self.dim is None:
+            self.dim = int(vector.shape[0])
+            with open(self.meta_path, 'w', encoding='utf-8') as f:
+                json.dump({'dim': self.dim}, f)
+        if vector.shape[0] != self.dim:
+            raise ValueError(f'Embedding dimension {vector.shape[0]} does not match index dimension {self.dim}')
+
+        data = np.ascontiguousarray(vector, dtype=np.float32).tobytes()
+        row = self.row_of.get(dream_id)
+        if row is None:
+            # New dream: append a row
+            with open(self.vectors_path, 'ab') as f:
+                row = f.tell() // (4 * self.dim)
+                f.write(data)
+        else:
+            # Edited dream: overwrite its row in place
+            with open(self.vectors_path, 'r+b') as f:
+                f.seek(row * 4 * self.dim)
+                f.write(data)
+        self._log({'row': row, 'dream_id': dream_id, 'title': title})
+
+    def remove(self, dream_id: str) -> bool:
+        row = self.row_of.get(dream_id)
+        if row is None:
+            return False
+        self._log({'row': row, 'dream_id': dream_id, 'deleted': True})
+        return True
+
+
+class DreamVectorStore:
+    """File-backed per-user index of dream embeddings for nearest-neighbour lookup.
+
+    Vectors are expected to be L2-normalized, so the inner product is the
+    cosine similarity. Each user's vectors are memory-mapped and searched
+    with one matrix-vector product.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+        self._users: Dict[str, _UserIndex] = {}
+        self._lock = threading.Lock()
+
+    def _index(self, user_id: str) -> _UserIndex:
+        safe_id = re.sub(r'[^A-Za-z0-9_-]', '_', str(user_id))
+        with self._lock:
+            if safe_id not in self._users:
+                self._users[safe_id] = _UserIndex(os.path.join(self.root, safe_id))
+            return self._users[safe_id]
+
+    def upsert(self, user_id: str, dream_id: str, vector, title: Optional[str] = None):
+        index = self._index(user_id)
+        with index.lock, index.writing():
+            index.upsert(str(dream_id), np.asarray(vector, dtype=np.float32), title)
+
+    def remove(self, user_id: str, dream_id: str) -> bool:
+        index = self._index(user_id)
+        with index.lock, index.writing():
+            return index.remove(str(dream_id))
+
+    def count(self, user_id: str) -> int:
+        index = self._index(user_id)
+        with index.lock:
+            index.refresh()
+            return len(index.row_of)
+
+    def contains(self, user_id: str, dream_id: str) -> bool:
+        index = self._index(user_id)
+        with index.lock:
+            index.refresh()
+            return str(dream_id) in index.row_of
+
+    def vector(self, user_id: str, dream_id: str) -> Optional[np.ndarray]:
+        index = self._index(user_id)
+        with index.lock:
+            index.refresh()
+            row = index.row_of.get(str(dream_id))
+            matrix = index.matrix()
+            return None if row is None or row >= len(matrix) else np.array(matrix[row])
+
+    def search(self, user_id: str, vector, k: int = 5, exclude: Optional[str] = None) -> List[Dict[str, Any]]:
+        index = self._index(user_id)
+        with index.lock:
+            index.refresh()
+            matrix = index.matrix()
+            if len(matrix) == 0 or k <= 0:
+                return []
+
+            scores = matrix @ np.asarray(vector, dtype=np.float32)
+            # Removed rows and the query dream itself never come back
+            scores[~index.alive(len(scores))] = -np.inf
+            if exclude is not None and index.row_of.get(str(exclude), len(scores)) < len(scores):
+                scores[index.row_of[str(exclude)]] = -np.inf
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [
+                {'dream_id': index.rows[row]['dream_id'], 'title': index.rows[row]['title'], 'score': float(scores[row])}
+                for row in top if np.isfinite(scores[row])
+            ]
+
+def vector_store_dir() -> str:
+    return os.getenv('NLP_VECTOR_STORE_DIR', os.path.join(os.path.dirname(__file__), 'data', 'vector_store'))
@@ -0,0 +1,191 @@
+import os
+import re
+import json
+import math
+import hashlib
+from collections import Counter
+from typing import Any, Dict, List
+
+import numpy as np
+
+from keywords import STOP_WORDS
+from lexicon import DreamLexicon
+
+TOKEN = re.compile(r"[a-z]+(?:'[a-z]+)?")
+
+# Weight of a word from an entry's name (e.g. "Flying/Freedom") vs. a word from its meaning
+NAME_WEIGHT = 1.0
+MEANING_WEIGHT = 0.3
+# Meaning words shared by more than this share of entries ("represents", "life") say nothing about the entry
+MAX_MEANING_SHARE = 0.1
+# Evidence a window has to outweigh before it leans away from neutral
+NEUTRAL_PRIOR = 1.0
+# Words after a negation ("not happy") have their sentiment flipped and no emotion
+NEGATION_SCOPE = 3
+
+
+def _inflections(word: str) -> List[str]:
+    """The word plus its regular inflections, so text tokens can be looked up exactly."""
+    forms = {word, f'{word}s', f'{word}es', f'{word}ed', f'{word}d', f'{word}ing', f'{word}ly'}
+    if word.endswith('e'):
+        forms.add(f'{word[:-1]}ing')
+    if word.endswith('y'):
+        forms.update({f'{word[:-1]}ies', f'{word[:-1]}ied'})
+    if len(word) <= 4 and word[-1] not in 'aeiouwy':
+        forms.update({f'{word}{word[-1]}ing', f'{word}{word[-1]}ed'})
+    return sorted(forms)
+
+
+class WordLexicon:
+    """Word-level emotion, sentiment and theme/symbol weights as dense matrices over one vocabulary.
+
+    Scoring a dream is a vocabulary lookup per token and a few indexed sums,
+    with no model: emotion (V x emotions), valence (V) and entry (V x lexicon
+    entries) matrices are built once from `path` and the DreamLexicon's names
+    and meanings. Entry columns follow the DreamLexicon's order, so matches go
+    through DreamLexicon.select like the embedding-based ones.
+    """
+
+    def __init__(self, path: str, lexicon: DreamLexicon):
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        self.lexicon = lexicon
+        self.emotions: List[str] = list(data['emotions'])
+
+        words: Dict[str, Dict[str, Any]] = {}
+
+        def entry_for(word: str) -> Dict[str, Any]:
+            return words.setdefault(word, {'emotions': set(), 'valence': 0.0, 'entries': {}, 'negation': False})
+
+        for column, emotion in enumerate(self.emotions):
+            for word in data['emotions'][emotion]:
+                for form in _inflections(word.lower()):
+                    entry_for(form)['emotions'].add(column)
+        for label, sign in (('positive', 1.0), ('negative', -1.0)):
+            for word in data['sentiment'][label]:
+                for form in _inflections(word.lower()):
+                    entry_for(form)['valence'] = sign
+        for word in data.get('negations', []):
+            entry_for(word.lower())['negation'] = True
+
+        meaning_words = [set(TOKEN.findall(meaning.lower())) - STOP_WORDS for meaning in lexicon.meanings]
+        shared = Counter(word for words_of in meaning_words for word in words_of)
+        max_share = max(1, int(MAX_MEANING_SHARE * len(lexicon.names)))
+        for column, (name, meaning_of) in enumerate(zip(lexicon.names, meaning_words)):
+            for word in meaning_of:
+                if shared[word] <= max_share and len(word) > 2:
+                    for form in _inflections(word):
+                        weights = entry_for(form)['entries']
+                        weights[column] = max(weights.get(column, 0.0), MEANING_WEIGHT)
+            for word in TOKEN.findall(name.lower()):
+                if word not in STOP_WORDS:
+                    for form in _inflections(word):
+                        entry_for(form)['entries'][column] = NAME_WEIGHT
+
+        self.vocabulary = {word: index for index, word in enumerate(sorted(words))}
+        size = len(self.vocabulary)
+        self.emotion_matrix = np.zeros((size, len(self.emotions)), dtype=np.float32)
+        self.valence = np.zeros(size, dtype=np.float32)
+        self.entry_matrix = np.zeros((size, len(lexicon.names)), dtype=np.float32)
+        self.negation = np.zeros(size, dtype=bool)
+        for word, index in self.vocabulary.items():
+            info = words[word]
+            self.emotion_matrix[index, sorted(info['emotions'])] = 1.0
+            self.valence[index] = info['valence']
+            self.negation[index] = info['negation']
+            for column, weight in info['entries'].items():
+                self.entry_matrix[index, column] = weight
+
+        digest = hashlib.sha256(json.dumps(data, sort_keys=True).encode('utf-8'))
+        digest.update(lexicon.version.encode('ascii'))
+        self.version = digest.hexdigest()[:16]
+
+    def score(self, sentences: List[str]) -> Dict[str, Any]:
+        """Per-sentence emotion and sentiment distributions (label/score, best first), lexicon entry scores and salience."""
+        tokens_per_sentence = [TOKEN.findall(sentence.lower()) for sentence in sentences]
+        ids, rows, starts = [], [], []
+        for row, tokens in enumerate(tokens_per_sentence):
+            start = len(ids)
+            for token in tokens:
+                ids.append(self.vocabulary.get(token, -1))
+                rows.append(row)
+                starts.append(start)
+        ids = np.asarray(ids, dtype=np.int64)
+        rows = np.asarray(rows, dtype=np.int64)
+        starts = np.asarray(starts, dtype=np.int64)
+
+        known = ids >= 0
+        negation_token = np.zeros(len(ids), dtype=np.int64)
+        negation_token[known] = self.negation[ids[known]]
+        # Negations among the NEGATION_SCOPE tokens before each token, within its sentence
+        seen = np.concatenate([[0], np.cumsum(negation_token)])
+        positions = np.arange(len(ids))
+        negated = (seen[positions] - seen[np.maximum(positions - NEGATION_SCOPE, starts)]) > 0
+
+        emotion_counts = np.zeros((len(sentences), len(self.emotions)), dtype=np.float32)
+        plain = known & ~negated
+        np.add.at(emotion_counts, rows[plain], self.emotion_matrix[ids[plain]])
+
+        valence = np.zeros(len(ids), dtype=np.float32)
+        valence[known] = self.valence[ids[known]]
+        valence[negated] *= -1
+        positive = np.bincount(rows, weights=np.maximum(valence, 0), minlength=len(sentences))
+        negative = np.bincount(rows, weights=np.maximum(-valence, 0), minlength=len(sentences))
+
+        entry_scores = np.zeros((len(sentences), len(self.lexicon.names)), dtype=np.float32)
+        np.add.at(entry_scores, rows[known], self.entry_matrix[ids[known]])
+
+        # Content words the dream repeats mark its central sentences
+        frequency = Counter(token for tokens in tokens_per_sentence for token in tokens
+                            if token not in STOP_WORDS and len(token) > 2)
+        salience = np.asarray([
+            sum(frequency.get(token, 0) for token in set(tokens)) / math.sqrt(len(tokens) or 1)
+            for tokens in tokens_per_sentence
+        ], dtype=np.float32)
+        salience += emotion_counts.sum(axis=1) + positive + negative + entry_scores.sum(axis=1)
+
+        emotion_totals = emotion_counts.sum(axis=1) + NEUTRAL_PRIOR
+        sentiment_totals = positive + negative + NEUTRAL_PRIOR
+        return {
+            'emotions': [self._distribution(self.emotions + ['neutral'],
+                                            list(counts) + [NEUTRAL_PRIOR], total)
+                         for counts, total in zip(emotion_counts, emotion_totals)],
+            'sentiment': [self._distribution(['positive', 'negative', 'neutral'], [pos, neg, NEUTRAL_PRIOR], total)
+                          for pos, neg, total in zip(positive, negative, sentiment_totals)],
+            # Saturating, so one name word scores ~0.63 and a single meaning word ~0.26
+            'entries': 1.0 - np.exp(-entry_scores),
+            'salience': salience,
+        }
+
+    @staticmethod
+    def _distribution(labels: List[str], weights: List[float], total: float) -> List[Dict[str, Any]]:
+        return sorted(({'label': label, 'score': float(weight) / float(total)} for label, weight in zip(labels, weights)),
+                      key=lambda result: result['score'], reverse=True)
+
+
+def extractive_summary(sentences: List[str], salience, max_sentences: int = 3, max_words: int = 80) -> str:
+    """The most salient sentences (about a quarter of the dream, at most `max_sentences`) in reading order.
+
+    Sentences that would take the summary past `max_words` are skipped; if even
+    the most salient one is longer, it is cut to `max_words` words.
+    """
+    if not sentences:
+        return ''
+    count = min(max_sentences, max(1, round(len(sentences) / 4)))
+    chosen, words = [], 0
+    # Stable: ties keep the earlier sentence
+    for i in sorted(range(len(sentences)), key=lambda i: -float(salience[i])):
+        length = len(sentences[i].split())
+        if words + length <= max_words:
+            chosen.append(i)
+            words += length
+        if len(chosen) == count:
+            break
+    if not chosen:
+        best = max(range(len(sentences)), key=lambda i: float(salience[i]))
+        return ' '.join(sentences[best].split()[:max_words])
+    return ' '.join(sentences[i].strip() for i in sorted(chosen))
+
+
+def word_lexicon_path() -> str:
+    return os.getenv('NLP_WORD_LEXICON_PATH', os.path.join(os.path.dirname(__file__), 'data', 'word_lexicon.json'))
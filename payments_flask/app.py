@@ -1,4 +1,7 @@
 import os
+import time
+import hmac
+import hashlib
 import razorpay
 import json
 from flask import Flask, request, jsonify
@@ -6,6 +9,9 @@ from flask_cors import CORS
 from datetime import datetime, timezone
 from supabase import create_client, Client
 from dotenv import load_dotenv
+from webhook_queue import queue_from_env
+from auth_tokens import InvalidToken, verifier_from_env
+from entitlements import EntitlementCache, PlanCatalog, entitlement_ttl_from_env
 
 load_dotenv()
 
@@ -19,6 +25,8 @@ SUPABASE_URL = os.getenv('SUPABASE_URL')
 SUPABASE_SERVICE_ROLE_KEY = os.getenv('SUPABASE_SERVICE_ROLE_KEY')
 FRONTEND_URL = os.getenv('FRONTEND_URL', 'http://localhost:5173')
 ALLOWED_ORIGINS = os.getenv('ALLOWED_ORIGINS', FRONTEND_URL)
+ENTITLEMENTS_SERVICE_KEY = os.getenv('ENTITLEMENTS_SERVICE_KEY')
+MAX_BULK_ENTITLEMENTS = 1000
 
 if not RAZORPAY_KEY_ID or not RAZORPAY_KEY_SECRET:
     raise RuntimeError('Missing RAZORPAY_KEY_ID or RAZORPAY_KEY_SECRET in environment')
@@ -38,6 +46,44 @@ PLANS = {
 }
 
 
+def _remote_user_id(access_token: str):
+    """User id for a token according to the Supabase auth server (network round trip)"""
+    user_resp = supabase.auth.get_user(access_token)
+    auth_user = getattr(user_resp, 'user', None) or (user_resp.get('user') if isinstance(user_resp, dict) else None)
+    return getattr(auth_user, 'id', None) or (auth_user.get('id') if isinstance(auth_user, dict) else None)
+
+
+# Access tokens are verified locally; get_user is only a fallback (AUTH_REMOTE_FALLBACK)
+token_verifier = verifier_from_env(SUPABASE_URL, remote=_remote_user_id)
+
+# Subscription events that change a subscription's state; others (e.g. subscription.charged)
+# must not make an earlier, late-delivered state change look stale
+ENDING_EVENTS = ('subscription.cancelled', 'subscription.halted', 'subscription.pending')
+STATE_EVENTS = ('subscription.activated',) + ENDING_EVENTS
+
+# Verified webhook events are queued durably and applied by a background worker
+webhook_queue = queue_from_env(state_events=STATE_EVENTS)
+
+
+def _fetch_active_subscriptions(user_ids=None) -> list:
+    """Active subscription rows for the given users (every user when None)"""
+    columns = 'user_id, plan, status, end_date, payment_id'
+    if user_ids is not None:
+        return supabase.table('subscriptions').select(columns).eq('status', 'active').in_('user_id', user_ids).execute().data or []
+    rows, page_size = [], 1000
+    while True:
+        page = supabase.table('subscriptions').select(columns).eq('status', 'active') \
+            .order('payment_id').range(len(rows), len(rows) + page_size - 1).execute().data or []
+        rows.extend(page)
+        if len(page) < page_size:
+            return rows
+
+
+# Plan lookups are served from memory; the webhook worker keeps entries current
+entitlements = EntitlementCache(_fetch_active_subscriptions, ttl=entitlement_ttl_from_env())
+plan_catalog = PlanCatalog(razorpay_client.plan.fetch)
+
+
 def _validate_plan(plan: str):
     if plan not in PLANS or not PLANS[plan]:
         raise ValueError('Invalid plan')
@@ -45,7 +91,59 @@ def _validate_plan(plan: str):
 
 @app.get('/health')
 def health():
-    return jsonify({'status': 'ok'}), 200
+    return jsonify({
+        'status': 'ok',
+        'webhook_queue': webhook_queue.stats(),
+        'entitlements': entitlements.stats(),
+    }), 200
+
+
+def _authorize_entitlements(user_id=None):
+    """None if the caller may read entitlements (service key, or a token for `user_id`), else an error response"""
+    service_key = request.headers.get('X-Service-Key')
+    if service_key and ENTITLEMENTS_SERVICE_KEY and hmac.compare_digest(service_key, ENTITLEMENTS_SERVICE_KEY):
+        return None
+    auth_header = request.headers.get('Authorization', '')
+    if user_id is None or not auth_header.startswith('Bearer '):
+        return jsonify({'error': 'Unauthorized', 'message': 'Service key or bearer token required'}), 401
+    try:
+        token_user_id = token_verifier.verify(auth_header.split(' ', 1)[1])
+    except InvalidToken as e:
+        return jsonify({'error': 'Unauthorized', 'message': str(e)}), 401
+    except Exception:
+        return jsonify({'error': 'Unauthorized', 'message': 'Failed to verify user'}), 401
+    if token_user_id != user_id:
+        return jsonify({'error': 'Forbidden', 'message': 'Cannot read another user\'s entitlement'}), 403
+    return None
+
+
+@app.get('/api/entitlements/<user_id>')
+def get_entitlement(user_id):
+    denied = _authorize_entitlements(user_id)
+    if denied:
+        return denied
+    try:
+        return jsonify({'user_id': user_id, **entitlements.get(user_id)}), 200
+    except Exception as e:
+        return jsonify({'error': 'Entitlement lookup failed', 'message': str(e)}), 500
+
+
+@app.post('/api/entitlements/bulk')
+def get_entitlements_bulk():
+    denied = _authorize_entitlements()
+    if denied:
+        return denied
+    data = request.get_json(silent=True) or {}
+    user_ids = data.get('user_ids')
+    if not isinstance(user_ids, list) or not all(isinstance(u, str) and u for u in user_ids):
+        return jsonify({'error': 'Invalid Request', 'message': 'user_ids must be a list of user ids'}), 400
+    if len(user_ids) > MAX_BULK_ENTITLEMENTS:
+        return jsonify({'error': 'Invalid Request',
+                        'message': f'At most {MAX_BULK_ENTITLEMENTS} user_ids per request'}), 400
+    try:
+        return jsonify({'entitlements': entitlements.get_many(list(dict.fromkeys(user_ids)))}), 200
+    except Exception as e:
+        return jsonify({'error': 'Entitlement lookup failed', 'message': str(e)}), 500
 
 
 @app.post('/api/create-checkout-session')
@@ -65,19 +163,13 @@ def create_checkout_session():
             return jsonify({'error': 'Unauthorized', 'message': 'Bearer token required'}), 401
         access_token = auth_header.split(' ', 1)[1]
         try:
-            user_resp = supabase.auth.get_user(access_token)
-            auth_user = getattr(user_resp, 'user', None) or user_resp.get('user') if isinstance(user_resp, dict) else None
-            if not auth_user:
-                return jsonify({'error': 'Unauthorized', 'message': 'Invalid token'}), 401
-            if auth_user.get('id') != user_id:
-                return jsonify({'error': 'Forbidden', 'message': 'Cannot create session for another user'}), 403
+            token_user_id = token_verifier.verify(access_token)
+        except InvalidToken as e:
+            return jsonify({'error': 'Unauthorized', 'message': str(e)}), 401
         except Exception:
-            # If SDK shape differs, attempt permissive format
-            try:
-                if user_resp.user.id != user_id:
-                    return jsonify({'error': 'Forbidden', 'message': 'Cannot create session for another user'}), 403
-            except Exception:
-                return jsonify({'error': 'Unauthorized', 'message': 'Failed to verify user'}), 401
+            return jsonify({'error': 'Unauthorized', 'message': 'Failed to verify user'}), 401
+        if token_user_id != user_id:
+            return jsonify({'error': 'Forbidden', 'message': 'Cannot create session for another user'}), 403
 
         plan_id = PLANS[plan]
 
@@ -127,65 +219,98 @@ def razorpay_webhook():
     except Exception as e:
         return jsonify({'error': 'Invalid signature/payload', 'message': str(e)}), 400
 
+    # Razorpay redelivers with the same event id; fall back to the payload hash
+    event_id = request.headers.get('X-Razorpay-Event-Id') or hashlib.sha256(payload.encode('utf-8')).hexdigest()
+    subscription_id = _subscription_entity(event).get('id')
+
     try:
+        stored = webhook_queue.enqueue(
+            event_id,
+            subscription_id or event_id,
+            event.get('event'),
+            event.get('created_at') or int(time.time()),
+            payload,
+        )
+    except Exception as e:
+        # Not stored: a non-2xx response makes Razorpay retry the delivery
+        return jsonify({'error': 'Webhook handling failed', 'message': str(e)}), 500
+
+    return jsonify({'received': True, 'duplicate': not stored}), 200
+
+
+def _subscription_entity(event: dict) -> dict:
+    return (((event.get('payload') or {}).get('subscription') or {}).get('entity')) or {}
+
+
+def _timestamp(ts) -> str:
+    return (datetime.fromtimestamp(ts, tz=timezone.utc) if ts else datetime.now(timezone.utc)).isoformat()
+
+
+def _apply_webhook_events(events: list):
+    """Apply a batch of queued events (at most one per subscription) with as few Supabase writes as possible.
+
+    Writes are idempotent, so a batch that fails part way can simply be retried.
+    """
+    activations = []
+    endings = {}
+    for queued in events:
+        event = queued['payload']
         event_type = event.get('event')
+        sub = _subscription_entity(event)
 
         if event_type == 'subscription.activated':
-            sub = (((event.get('payload') or {}).get('subscription') or {}).get('entity')) or {}
-            subscription_id = sub.get('id')
-            plan_id = sub.get('plan_id')
-            notes = sub.get('notes') or {}
-            user_id = notes.get('user_id')
-            plan = 'pro' if plan_id == RAZORPAY_PLAN_PRO else ('premium' if plan_id == RAZORPAY_PLAN_PREMIUM else 'unknown')
-
-            # Fetch plan details for amount/currency
-            amount = 0
-            currency = 'INR'
-            try:
-                plan_details = razorpay_client.plan.fetch(plan_id)
-                item = plan_details.get('item', {}) if isinstance(plan_details, dict) else {}
-                amount = (item.get('amount') or 0) / 100.0
-                currency = item.get('currency', 'INR')
-            except Exception:
-                pass
-
-            period_start_ts = sub.get('current_start') or sub.get('start_at')
-            period_end_ts = sub.get('current_end') or sub.get('charge_at')
-            period_start = datetime.fromtimestamp(period_start_ts, tz=timezone.utc) if period_start_ts else datetime.now(timezone.utc)
-            period_end = datetime.fromtimestamp(period_end_ts, tz=timezone.utc) if period_end_ts else datetime.now(timezone.utc)
-
-            if user_id:
-                # Ensure only one active subscription per user: expire previous
-                supabase.table('subscriptions').update({'status': 'expired'}).eq('user_id', user_id).eq('status', 'active').execute()
-
-                # Insert new subscription row
-                insert_payload = {
-                    'user_id': user_id,
-                    'plan': plan,
-                    'status': 'active',
-                    'amount': amount,
-                    'currency': currency,
-                    'payment_provider': 'razorpay',
-                    'payment_id': subscription_id,
-                    'start_date': period_start.isoformat(),
-                    'end_date': period_end.isoformat(),
-                }
-                supabase.table('subscriptions').insert(insert_payload).execute()
-
-        elif event_type in ('subscription.cancelled', 'subscription.halted', 'subscription.pending'):
-            sub = (((event.get('payload') or {}).get('subscription') or {}).get('entity')) or {}
-            subscription_id = sub.get('id')
+            if (sub.get('notes') or {}).get('user_id'):
+                activations.append((queued['created_at'], sub))
+
+        elif event_type in ENDING_EVENTS:
             # Map to canceled; adjust if you want different states for 'halted' or 'pending'
-            mapped_status = 'canceled'
             end_ts = sub.get('current_end') or sub.get('ended_at') or datetime.now(timezone.utc).timestamp()
-            supabase.table('subscriptions').update({
-                'status': mapped_status,
-                'end_date': datetime.fromtimestamp(end_ts, tz=timezone.utc).isoformat()
-            }).eq('payment_id', subscription_id).execute()
+            endings.setdefault(_timestamp(end_ts), []).append((sub.get('id'), (sub.get('notes') or {}).get('user_id')))
+
+    if activations:
+        prices = {plan_id: plan_catalog.price(plan_id) for plan_id in {sub.get('plan_id') for _, sub in activations}}
+        rows = {}
+        # Oldest first, so a user's latest activation in the batch is the one left active
+        for _, sub in sorted(activations, key=lambda a: a[0]):
+            user_id = sub['notes']['user_id']
+            plan_id = sub.get('plan_id')
+            for row in rows.values():
+                if row['user_id'] == user_id:
+                    row['status'] = 'expired'
+            amount, currency = prices[plan_id]
+            rows[sub.get('id')] = {
+                'user_id': user_id,
+                'plan': 'pro' if plan_id == RAZORPAY_PLAN_PRO else ('premium' if plan_id == RAZORPAY_PLAN_PREMIUM else 'unknown'),
+                'status': 'active',
+                'amount': amount,
+                'currency': currency,
+                'payment_provider': 'razorpay',
+                'payment_id': sub.get('id'),
+                'start_date': _timestamp(sub.get('current_start') or sub.get('start_at')),
+                'end_date': _timestamp(sub.get('current_end') or sub.get('charge_at')),
+            }
 
-        return jsonify({'received': True}), 200
-    except Exception as e:
-        return jsonify({'error': 'Webhook handling failed', 'message': str(e)}), 500
+        # Ensure only one active subscription per user: expire previous, then upsert on payment_id
+        # so a redelivered activation updates its row instead of adding a duplicate
+        users = sorted({row['user_id'] for row in rows.values()})
+        supabase.table('subscriptions').update({'status': 'expired'}).in_('user_id', users).eq('status', 'active').execute()
+        supabase.table('subscriptions').upsert(list(rows.values()), on_conflict='payment_id').execute()
+        for row in rows.values():
+            if row['status'] == 'active':
+                entitlements.set_active(row['user_id'], row)
+
+    for end_date, ended in endings.items():
+        supabase.table('subscriptions').update({
+            'status': 'canceled',
+            'end_date': end_date
+        }).in_('payment_id', [subscription_id for subscription_id, _ in ended]).execute()
+        for subscription_id, user_id in ended:
+            entitlements.end(subscription_id, 'canceled', end_date, user_id)
+
+
+webhook_queue.start(_apply_webhook_events)
+entitlements.start_refresh()
+plan_catalog.warm(PLANS.values())
 
 
 if __name__ == '__main__':
@@ -0,0 +1,171 @@
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidToken(Exception):
+    """The access token is malformed, expired, or its signature does not verify."""
+
+
+class _Unverifiable(Exception):
+    """The token may be fine, but there is no local key to check it with."""
+
+
+def _b64decode(segment: str) -> bytes:
+    return base64.urlsafe_b64decode(segment + '=' * (-len(segment) % 4))
+
+
+class TokenVerifier:
+    """Verifies Supabase access tokens locally and caches the result per token.
+
+    HS256 tokens are checked with the project's JWT secret using only the
+    standard library; asymmetric tokens are checked against the project's JWKS
+    when PyJWT is installed. Signature, expiry, not-before, audience, issuer and
+    `sub` are validated. A verified token maps to its user id until it expires
+    (or `cache_ttl` passes). Tokens that cannot be checked locally go to
+    `remote` (e.g. supabase.auth.get_user) if one is given; tokens that fail
+    local checks are rejected without a network call.
+    """
+
+    def __init__(self, jwt_secret: Optional[str] = None, jwks_url: Optional[str] = None,
+                 issuer: Optional[str] = None, audience: str = 'authenticated',
+                 remote: Optional[Callable[[str], Optional[str]]] = None,
+                 cache_size: int = 1024, cache_ttl: float = 300, leeway: float = 30):
+        self.jwt_secret = jwt_secret.encode('utf-8') if jwt_secret else None
+        self.jwks_url = jwks_url
+        self.issuer = issuer
+        self.audience = audience
+        self.remote = remote
+        self.cache_size = max(0, int(cache_size))
+        self.cache_ttl = cache_ttl
+        self.leeway = leeway
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._jwks_client = None
+
+    def verify(self, token: str) -> str:
+        """Return the user id the token was issued to, or raise InvalidToken."""
+        key = hashlib.sha256(token.encode('utf-8')).hexdigest()
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                user_id, expires_at = entry
+                if now < expires_at:
+                    self._cache.move_to_end(key)
+                    return user_id
+                del self._cache[key]
+
+        try:
+            user_id, exp = self._verify_locally(token, now)
+        except _Unverifiable as e:
+            if not self.remote:
+                raise InvalidToken(str(e))
+            user_id = self.remote(token)
+            if not user_id:
+                raise InvalidToken('Invalid token')
+            # Unverified claim: Supabase accepted the token, so a junk exp only limits caching
+            exp = self._claims(token).get('exp')
+            if isinstance(exp, bool) or not isinstance(exp, (int, float)):
+                exp = now + self.cache_ttl
+
+        self._remember(key, user_id, min(float(exp), now + self.cache_ttl))
+        return user_id
+
+    def _remember(self, key: str, user_id: str, expires_at: float):
+        if self.cache_size == 0:
+            return
+        with self._lock:
+            self._cache[key] = (user_id, expires_at)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _claims(self, token: str) -> dict:
+        try:
+            claims = json.loads(_b64decode(token.split('.')[1]))
+        except Exception:
+            return {}
+        return claims if isinstance(claims, dict) else {}
+
+    def _verify_locally(self, token: str, now: float) -> tuple:
+        try:
+            header_segment, payload_segment, signature_segment = token.split('.')
+            header = json.loads(_b64decode(header_segment))
+            claims = json.loads(_b64decode(payload_segment))
+            signature = _b64decode(signature_segment)
+        except Exception:
+            raise InvalidToken('Malformed token')
+
+        algorithm = header.get('alg')
+        if algorithm == 'HS256':
+            if not self.jwt_secret:
+                raise _Unverifiable('No JWT secret configured')
+            expected = hmac.new(self.jwt_secret, f'{header_segment}.{payload_segment}'.encode('ascii'),
+                                hashlib.sha256).digest()
+            if not hmac.compare_digest(expected, signature):
+                raise InvalidToken('Invalid token signature')
+        elif algorithm in ('RS256', 'ES256'):
+            self._verify_with_jwks(token)
+        else:
+            raise InvalidToken(f'Unsupported token algorithm {algorithm!r}')
+
+        exp = claims.get('exp')
+        if not isinstance(exp, (int, float)) or exp + self.leeway < now:
+            raise InvalidToken('Token expired')
+        nbf = claims.get('nbf')
+        if isinstance(nbf, (int, float)) and nbf - self.leeway > now:
+            raise InvalidToken('Token not yet valid')
+        audience = claims.get('aud')
+        if self.audience and self.audience not in (audience if isinstance(audience, list) else [audience]):
+            raise InvalidToken('Invalid token audience')
+        if self.issuer and claims.get('iss') != self.issuer:
+            raise InvalidToken('Invalid token issuer')
+        if not claims.get('sub'):
+            raise InvalidToken('Token has no subject')
+        return claims['sub'], exp
+
+    def _verify_with_jwks(self, token: str):
+        if not self.jwks_url:
+            raise _Unverifiable('No JWKS URL configured')
+        try:
+            import jwt
+        except ImportError:
+            raise _Unverifiable('PyJWT is not installed')
+
+        try:
+            if self._jwks_client is None:
+                # PyJWKClient caches the key set and refetches it for unknown key ids
+                self._jwks_client = jwt.PyJWKClient(self.jwks_url, cache_keys=True, lifespan=3600)
+            signing_key = self._jwks_client.get_signing_key_from_jwt(token)
+        except jwt.PyJWKClientError as e:
+            raise _Unverifiable(f'Signing key unavailable: {e}')
+        try:
+            # Claims are checked by the caller, with the same leeway as HS256 tokens
+            jwt.decode(token, signing_key.key, algorithms=['RS256', 'ES256'],
+                       options={'verify_exp': False, 'verify_nbf': False, 'verify_aud': False, 'verify_iss': False})
+        except jwt.InvalidTokenError:
+            raise InvalidToken('Invalid token signature')
+
+
+def verifier_from_env(supabase_url: Optional[str], remote: Optional[Callable[[str], Optional[str]]] = None) -> TokenVerifier:
+    """Build a TokenVerifier from SUPABASE_JWT_SECRET / SUPABASE_JWKS_URL / AUTH_REMOTE_FALLBACK / AUTH_CACHE_*."""
+    base = (supabase_url or '').rstrip('/')
+    fallback = os.getenv('AUTH_REMOTE_FALLBACK', 'true').strip().lower() in ('1', 'true', 'yes')
+    return TokenVerifier(
+        jwt_secret=os.getenv('SUPABASE_JWT_SECRET') or None,
+        jwks_url=os.getenv('SUPABASE_JWKS_URL') or (f'{base}/auth/v1/.well-known/jwks.json' if base else None),
+        issuer=f'{base}/auth/v1' if base else None,
+        remote=remote if fallback else None,
+        cache_size=int(os.getenv('AUTH_CACHE_SIZE', 1024)),
+        cache_ttl=float(os.getenv('AUTH_CACHE_TTL_SECONDS', 300)),
+    )
@@ -0,0 +1,161 @@
+import os
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Reload this often (as a share of ttl), so a reload finishes before the previous one's entries expire
+REFRESH_FRACTION = 0.5
+
+FREE = {'plan': 'free', 'status': 'none', 'active': False, 'end_date': None, 'payment_id': None}
+
+
+def _entitlement(row: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if not row:
+        return dict(FREE)
+    active = row.get('status') == 'active'
+    return {
+        'plan': row.get('plan') if active else 'free',
+        'status': row.get('status'),
+        'active': active,
+        'end_date': row.get('end_date'),
+        'payment_id': row.get('payment_id'),
+    }
+
+
+class EntitlementCache:
+    """In-process map of user id -> current plan, kept in sync by the webhook worker.
+
+    `fetch_active(user_ids)` returns the active subscription rows for those
+    users (all users when None). The cache is warmed with every active row at
+    startup and reloaded every `ttl * REFRESH_FRACTION` seconds, so changes
+    applied by another process sharing the table are picked up; in between, a
+    user with no entry has no active subscription. While a reload is running,
+    entries stay valid for up to twice the ttl, so a slow reload does not send
+    lookups to the table. Webhook handlers update entries directly.
+    """
+
+    def __init__(self, fetch_active: Callable[[Optional[List[str]]], Iterable[Dict[str, Any]]], ttl: float = 300):
+        self.fetch_active = fetch_active
+        self.ttl = ttl
+        self._entries: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._warmed_at = None
+        self._warming = False
+
+    def warm(self):
+        """Load every active subscription; lookups before this completes read through to the table."""
+        start = time.perf_counter()
+        now = time.time()
+        self._warming = True
+        try:
+            entries = {row['user_id']: (_entitlement(row), now) for row in self.fetch_active(None)}
+        finally:
+            self._warming = False
+        with self._lock:
+            # Keep updates made by webhooks while the table was being read
+            entries.update({uid: entry for uid, entry in self._entries.items() if entry[1] > now})
+            self._entries = entries
+            self._warmed_at = now
+        logger.info(f"Entitlement cache warmed with {len(entries)} active subscriptions "
+                    f"in {time.perf_counter() - start:.2f}s")
+
+    def start_refresh(self):
+        """Warm now and reload every `ttl * REFRESH_FRACTION` seconds (start to start), in a background thread."""
+        interval = self.ttl * REFRESH_FRACTION
+
+        def run():
+            while True:
+                started = time.monotonic()
+                try:
+                    self.warm()
+                except Exception as e:
+                    logger.error(f"Entitlement cache refresh failed: {e}")
+                time.sleep(max(0.0, interval - (time.monotonic() - started)))
+        threading.Thread(target=run, name='entitlements-refresh', daemon=True).start()
+
+    def get(self, user_id: str) -> Dict[str, Any]:
+        return self.get_many([user_id])[user_id]
+
+    def get_many(self, user_ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        now = time.time()
+        results, stale = {}, []
+        with self._lock:
+            max_age = self.ttl * 2 if self._warming else self.ttl
+            for user_id in user_ids:
+                entry = self._entries.get(user_id)
+                if entry is not None and now - entry[1] < max_age:
+                    results[user_id] = entry[0]
+                elif entry is None and self._warmed_at is not None and now - self._warmed_at < max_age:
+                    # Warmed recently and not seen: no active subscription
+                    results[user_id] = dict(FREE)
+                else:
+                    stale.append(user_id)
+
+        if stale:
+            rows = {row['user_id']: row for row in self.fetch_active(stale)}
+            with self._lock:
+                for user_id in stale:
+                    results[user_id] = _entitlement(rows.get(user_id))
+                    self._entries[user_id] = (results[user_id], now)
+        return results
+
+    def set_active(self, user_id: str, row: Dict[str, Any]):
+        """Record a subscription that was just activated for the user."""
+        with self._lock:
+            self._entries[user_id] = (_entitlement({**row, 'status': 'active'}), time.time())
+
+    def end(self, payment_id: str, status: str, end_date: Optional[str], user_id: Optional[str] = None):
+        """Record that a subscription ended, if it is the one the user's entitlement comes from."""
+        with self._lock:
+            candidates = [user_id] if user_id else [uid for uid, (e, _) in self._entries.items()
+                                                    if e['payment_id'] == payment_id]
+            for uid in candidates:
+                entry = self._entries.get(uid)
+                if entry is not None and entry[0]['payment_id'] == payment_id:
+                    self._entries[uid] = (_entitlement({'plan': 'free', 'status': status, 'end_date': end_date,
+                                                        'payment_id': payment_id}), time.time())
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'entries': len(self._entries), 'warmed_at': self._warmed_at}
+
+
+class PlanCatalog:
+    """Razorpay plan details (amount, currency) fetched once per plan and refreshed after `ttl` seconds."""
+
+    def __init__(self, fetch_plan: Callable[[str], Dict[str, Any]], ttl: float = 86400):
+        self.fetch_plan = fetch_plan
+        self.ttl = ttl
+        self._plans: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+
+    def price(self, plan_id: str) -> tuple:
+        """(amount, currency) of a plan; (0, 'INR') if it cannot be fetched."""
+        now = time.time()
+        with self._lock:
+            entry = self._plans.get(plan_id)
+        if entry is not None and now - entry[1] < self.ttl:
+            return entry[0]
+        try:
+            plan_details = self.fetch_plan(plan_id)
+            item = plan_details.get('item', {}) if isinstance(plan_details, dict) else {}
+            price = ((item.get('amount') or 0) / 100.0, item.get('currency', 'INR'))
+        except Exception as e:
+            logger.error(f"Fetching Razorpay plan {plan_id} failed: {e}")
+            # Keep serving the last known price rather than recording 0
+            return entry[0] if entry is not None else (0, 'INR')
+        with self._lock:
+            self._plans[plan_id] = (price, now)
+        return price
+
+    def warm(self, plan_ids: Iterable[str]):
+        for plan_id in plan_ids:
+            if plan_id:
+                self.price(plan_id)
+
+
+def entitlement_ttl_from_env() -> float:
+    return float(os.getenv('ENTITLEMENT_CACHE_TTL_SECONDS', 300))
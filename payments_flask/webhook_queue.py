@@ -0,0 +1,236 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    event_id TEXT NOT NULL UNIQUE,
+    ordering_key TEXT NOT NULL,
+    event_type TEXT,
+    created_at INTEGER NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    claimed_at REAL,
+    last_error TEXT,
+    received_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_events_pending ON events(status, ordering_key, created_at, seq);
+CREATE TABLE IF NOT EXISTS applied (
+    ordering_key TEXT PRIMARY KEY,
+    created_at INTEGER NOT NULL
+);
+"""
+
+
+class WebhookQueue:
+    """Durable SQLite queue of verified webhook events, deduplicated by event id.
+
+    The webhook handler only enqueues (one small transaction), so it can
+    acknowledge right away; redeliveries of a stored event id are ignored. A
+    background thread claims pending events in batches and hands them to
+    `apply_batch`. At most one event per ordering key (the subscription) is in
+    a batch, and a key's next event is not claimed until the previous one is
+    done, so events apply in order per subscription even across processes
+    sharing the file. A state-changing event (type in `state_events`, or any
+    type when None) older than the last state change applied for its key is
+    skipped; other events neither advance nor are checked against it. When a
+    batch fails, its events are applied one at a time so only the failing ones
+    are retried, with exponential backoff.
+    """
+
+    def __init__(self, path: str, batch_size: int = 50, max_attempts: int = 8,
+                 poll_seconds: float = 1.0, retention_days: float = 7, claim_timeout: float = 300,
+                 state_events: Optional[Iterable[str]] = None):
+        self.path = path
+        self.state_events = set(state_events) if state_events is not None else None
+        self.batch_size = max(1, int(batch_size))
+        self.max_attempts = max(1, int(max_attempts))
+        self.poll_seconds = poll_seconds
+        self.retention = retention_days * 86400
+        self.claim_timeout = claim_timeout
+        self._local = threading.local()
+        self._wakeup = threading.Event()
+        self._worker = None
+        self._worker_pid = None
+        self._last_purge = 0.0
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread (and per process, since connections must not cross a fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def enqueue(self, event_id: str, ordering_key: str, event_type: Optional[str],
+                created_at: int, payload: str) -> bool:
+        """Store a verified event. Returns False if this event id was already received."""
+        cursor = self._connection().execute(
+            'INSERT OR IGNORE INTO events (event_id, ordering_key, event_type, created_at, payload, received_at) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            (event_id, ordering_key, event_type, int(created_at), payload, time.time())
+        )
+        self._wakeup.set()
+        return cursor.rowcount == 1
+
+    def start(self, apply_batch: Callable[[List[Dict[str, Any]]], None]):
+        """Start the background worker in this process (threads do not survive fork)."""
+        if self._worker is not None and self._worker_pid == os.getpid() and self._worker.is_alive():
+            return
+        self._worker_pid = os.getpid()
+        self._worker = threading.Thread(target=self._run, args=(apply_batch,), name='webhook-worker', daemon=True)
+        self._worker.start()
+
+    def _changes_state(self, event_type: Optional[str]) -> bool:
+        return self.state_events is None or event_type in self.state_events
+
+    def stats(self) -> Dict[str, int]:
+        rows = self._connection().execute('SELECT status, COUNT(*) FROM events GROUP BY status').fetchall()
+        return {status: count for status, count in rows}
+
+    def _claim(self) -> List[Dict[str, Any]]:
+        now = time.time()
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Claims left behind by a crashed worker become pending again
+            conn.execute("UPDATE events SET status = 'pending' WHERE status = 'processing' AND claimed_at < ?",
+                         (now - self.claim_timeout,))
+            rows = conn.execute("""
+                SELECT e.seq, e.event_id, e.ordering_key, e.event_type, e.created_at, e.payload, e.attempts,
+                       a.created_at AS applied_at
+                FROM events e LEFT JOIN applied a ON a.ordering_key = e.ordering_key
+                WHERE e.status = 'pending' AND e.next_attempt_at <= ?
+                  AND NOT EXISTS (
+                    SELECT 1 FROM events p
+                    WHERE p.ordering_key = e.ordering_key AND p.seq != e.seq
+                      AND (p.status = 'processing'
+                           OR (p.status = 'pending' AND (p.created_at, p.seq) < (e.created_at, e.seq))))
+                ORDER BY e.created_at, e.seq
+                LIMIT ?
+            """, (now, self.batch_size)).fetchall()
+
+            events, stale = [], []
+            for row in rows:
+                if (row['applied_at'] is not None and row['created_at'] < row['applied_at']
+                        and self._changes_state(row['event_type'])):
+                    stale.append(row['seq'])
+                else:
+                    events.append({**dict(row), 'payload': json.loads(row['payload'])})
+            if stale:
+                conn.executemany("UPDATE events SET status = 'skipped' WHERE seq = ?", [(seq,) for seq in stale])
+            if events:
+                conn.executemany("UPDATE events SET status = 'processing', claimed_at = ? WHERE seq = ?",
+                                 [(now, event['seq']) for event in events])
+            conn.execute('COMMIT')
+            return events
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _complete(self, events: List[Dict[str, Any]]):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany("UPDATE events SET status = 'done', last_error = NULL WHERE seq = ?",
+                             [(event['seq'],) for event in events])
+            conn.executemany(
+                'INSERT INTO applied (ordering_key, created_at) VALUES (?, ?) '
+                'ON CONFLICT(ordering_key) DO UPDATE SET created_at = MAX(created_at, excluded.created_at)',
+                [(event['ordering_key'], event['created_at']) for event in events
+                 if self._changes_state(event['event_type'])]
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _retry(self, events: List[Dict[str, Any]], error: Exception):
+        now = time.time()
+        updates = []
+        for event in events:
+            attempts = event['attempts'] + 1
+            status = 'failed' if attempts >= self.max_attempts else 'pending'
+            updates.append((status, attempts, now + min(300, 2 ** attempts), str(error), event['seq']))
+        self._connection().executemany(
+            'UPDATE events SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ? WHERE seq = ?', updates
+        )
+
+    def _purge(self):
+        now = time.time()
+        if now - self._last_purge < 3600:
+            return
+        self._last_purge = now
+        # Done events are kept for the retention period so redeliveries are still recognized
+        self._connection().execute("DELETE FROM events WHERE status IN ('done', 'skipped') AND received_at < ?",
+                                   (now - self.retention,))
+
+    def _run(self, apply_batch: Callable[[List[Dict[str, Any]]], None]):
+        while True:
+            try:
+                events = self._claim()
+            except Exception as e:
+                logger.error(f"Webhook queue claim failed: {e}")
+                events = []
+
+            if not events:
+                try:
+                    self._purge()
+                except Exception as e:
+                    logger.error(f"Webhook queue purge failed: {e}")
+                self._wakeup.wait(self.poll_seconds)
+                self._wakeup.clear()
+                continue
+
+            try:
+                apply_batch(events)
+            except Exception as e:
+                logger.error(f"Applying {len(events)} webhook events failed: {e}")
+                if len(events) == 1:
+                    self._settle(events, e)
+                    continue
+                # Apply one at a time so one bad event does not use up its neighbours' attempts
+                for event in events:
+                    try:
+                        apply_batch([event])
+                    except Exception as e:
+                        logger.error(f"Applying webhook event {event['event_id']} failed: {e}")
+                        self._settle([event], e)
+                    else:
+                        self._settle([event])
+                continue
+            self._settle(events)
+
+    def _settle(self, events: List[Dict[str, Any]], error: Optional[Exception] = None):
+        """Mark events done (or schedule a retry); left 'processing' on failure, so they are reclaimed later."""
+        try:
+            if error is None:
+                self._complete(events)
+            else:
+                self._retry(events, error)
+        except Exception as e:
+            logger.error(f"Recording the outcome of {len(events)} webhook events failed: {e}")
+
+
+def queue_from_env(state_events: Optional[Iterable[str]] = None) -> WebhookQueue:
+    """Build a WebhookQueue configured by WEBHOOK_QUEUE_DB / WEBHOOK_BATCH_SIZE / WEBHOOK_MAX_ATTEMPTS."""
+    return WebhookQueue(
+        os.getenv('WEBHOOK_QUEUE_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'webhook_events.db')),
+        batch_size=int(os.getenv('WEBHOOK_BATCH_SIZE', 50)),
+        max_attempts=int(os.getenv('WEBHOOK_MAX_ATTEMPTS', 8)),
+        state_events=state_events,
+    )
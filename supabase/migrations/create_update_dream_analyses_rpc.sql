@@ -0,0 +1,18 @@
+-- Bulk write of re-analysis results (nlp_backend/reanalyze.py): one call per batch,
+-- touching only the analysis column. Returns the number of dreams updated.
+CREATE OR REPLACE FUNCTION update_dream_analyses(updates JSONB)
+RETURNS INTEGER AS $$
+DECLARE
+  updated INTEGER;
+BEGIN
+  UPDATE dreams d
+  SET analysis = u.analysis
+  FROM jsonb_to_recordset(updates) AS u(id UUID, analysis JSONB)
+  WHERE d.id = u.id;
+  GET DIAGNOSTICS updated = ROW_COUNT;
+  RETURN updated;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Service role only
+REVOKE EXECUTE ON FUNCTION update_dream_analyses(JSONB) FROM PUBLIC, anon, authenticated;